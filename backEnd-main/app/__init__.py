@@ -12,7 +12,7 @@ db = SQLAlchemy()
 migrate = Migrate()
 
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
     
     # Enable CORS for all routes
@@ -20,12 +20,33 @@ def create_app():
          methods=["GET", "POST", "DELETE", "PUT", "OPTIONS"])
 
     # Load configurations
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+
+    # Pool sizing for server databases, connection PRAGMAs for SQLite
+    from app import database
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config)
 
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+    database.init_app(app, db)
+
+
+    # Keep the per-term balance summary in step with payment writes
+    from app import balances  # noqa: F401
+
+    # Full-text student search index, created alongside the student table
+    from app import search  # noqa: F401
+
+    # Per-route latency and SQL histograms on /metrics
+    if app.config.get('METRICS_ENABLED'):
+        from app import metrics
+        metrics.init_app(app, db)
 
+    # N+1 detection and query budgets for development and tests
+    if app.config.get('QUERY_WATCH'):
+        from app import querywatch
+        querywatch.init_app(app, db)
 
     # Import and register routes
     from app.routes import routes  # Use a relative import to get the routes
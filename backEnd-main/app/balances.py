@@ -0,0 +1,162 @@
+from app.models import db, Student, Payment, BusPayment, StudentTermBalance
+from collections import defaultdict
+from sqlalchemy import event, inspect, update, insert, select, union_all, cast, literal, func, true, Integer
+from sqlalchemy.dialects import sqlite, postgresql
+
+SUMMARY_KEY = ['student_id', 'term_id']
+_upsert_dialects = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def upsert_summary_stmt(dialect_name, select_stmt, columns, assign):
+    """
+    INSERT ... SELECT into student_term_balance. On conflict each column in
+    assign is either added to ('add') or overwritten with ('set') the new value.
+    """
+    table = StudentTermBalance.__table__
+    stmt = _upsert_dialects[dialect_name](table).from_select(columns, select_stmt)
+    return stmt.on_conflict_do_update(
+        index_elements=SUMMARY_KEY,
+        set_={
+            column: table.c[column] + stmt.excluded[column] if mode == 'add' else stmt.excluded[column]
+            for column, mode in assign.items()
+        },
+    )
+
+
+def summary_value(term_id, column):
+    """A student's summary column for the term, or 0 without a row, as a correlated subquery."""
+    return func.coalesce(
+        select(column)
+        .where(StudentTermBalance.student_id == Student.id, StudentTermBalance.term_id == term_id)
+        .scalar_subquery(),
+        0,
+    )
+
+
+def open_term_summaries(session, term_id, *criteria):
+    """
+    Open the term's summary rows for the students matching criteria from
+    their balance columns. Arrears are what the term brought forward, and the
+    rest of the balance plus anything already paid in the term is what it
+    billed, so each row's balance equals the student's balance afterwards.
+    """
+    arrears = func.coalesce(Student.arrears, 0)
+    session.execute(upsert_summary_stmt(
+        session.get_bind().dialect.name,
+        select(
+            Student.id,
+            literal(term_id),
+            arrears,
+            func.coalesce(Student.balance, 0) - arrears + summary_value(term_id, StudentTermBalance.paid),
+            func.coalesce(Student.bus_balance, 0) + summary_value(term_id, StudentTermBalance.bus_paid),
+        ).where(true(), *criteria),
+        ['student_id', 'term_id', 'arrears_brought_forward', 'billed', 'bus_billed'],
+        {'arrears_brought_forward': 'set', 'billed': 'set', 'bus_billed': 'set'},
+    ))
+
+
+def rebuild_paid_totals(session):
+    """
+    Recompute the paid columns of the summary from the payment ledger. Use
+    after loading payments with Core inserts, which bypass the flush hook.
+    """
+    session.execute(update(StudentTermBalance).values(paid=0, payment_count=0, bus_paid=0))
+    ledger = union_all(
+        select(Payment.student_id.label('student_id'), cast(Payment.term_id, Integer).label('term_id'),
+               Payment.amount.label('paid'), literal(1).label('payment_count'), literal(0.0).label('bus_paid')),
+        select(BusPayment.student_id, BusPayment.term_id, literal(0.0), literal(0), BusPayment.amount),
+    ).subquery()
+    totals = (
+        select(ledger.c.student_id, ledger.c.term_id, func.sum(ledger.c.paid),
+               func.sum(ledger.c.payment_count), func.sum(ledger.c.bus_paid))
+        .where(true())  # lets SQLite parse INSERT ... SELECT ... ON CONFLICT
+        .group_by(ledger.c.student_id, ledger.c.term_id)
+    )
+    session.execute(upsert_summary_stmt(
+        session.get_bind().dialect.name,
+        totals,
+        ['student_id', 'term_id', 'paid', 'payment_count', 'bus_paid'],
+        {'paid': 'set', 'payment_count': 'set', 'bus_paid': 'set'},
+    ))
+
+
+def apply_deltas(connection, deltas):
+    """
+    Add {(student_id, term_id): {column: delta}} onto the summary rows,
+    creating any row that does not exist yet. Rows touching the same columns
+    share one executemany statement.
+    """
+    table = StudentTermBalance.__table__
+    groups = defaultdict(list)
+    for (student_id, term_id), changes in deltas.items():
+        changes = {column: delta for column, delta in changes.items() if delta}
+        if changes:
+            groups[tuple(sorted(changes))].append(dict(changes, student_id=student_id, term_id=term_id))
+
+    dialect_insert = _upsert_dialects.get(connection.dialect.name)
+    for columns, params in groups.items():
+        if dialect_insert:
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=SUMMARY_KEY,
+                set_={column: table.c[column] + stmt.excluded[column] for column in columns},
+            )
+            connection.execute(stmt, params)
+            continue
+
+        for row in params:
+            result = connection.execute(
+                update(table)
+                .where(table.c.student_id == row['student_id'], table.c.term_id == row['term_id'])
+                .values({column: table.c[column] + row[column] for column in columns})
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(**row))
+
+
+def _committed(obj, attribute):
+    """The value an attribute had when the object was loaded."""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attribute)
+
+
+def _contribution(obj, value):
+    """(summary key, column deltas) a payment adds to the summary."""
+    if isinstance(obj, Payment):
+        key = (value(obj, 'student_id'), int(value(obj, 'term_id')))
+        return key, {'paid': value(obj, 'amount'), 'payment_count': 1}
+    key = (value(obj, 'student_id'), value(obj, 'term_id'))
+    return key, {'bus_paid': value(obj, 'amount')}
+
+
+def collect_deltas(session):
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(obj, value, sign):
+        key, changes = _contribution(obj, value)
+        for column, amount in changes.items():
+            deltas[key][column] += sign * amount
+
+    for obj in session.new:
+        if isinstance(obj, (Payment, BusPayment)):
+            add(obj, getattr, 1)
+    for obj in session.deleted:
+        if isinstance(obj, (Payment, BusPayment)):
+            add(obj, _committed, -1)
+    for obj in session.dirty:
+        if isinstance(obj, (Payment, BusPayment)) and session.is_modified(obj):
+            add(obj, _committed, -1)
+            add(obj, getattr, 1)
+    return deltas
+
+
+@event.listens_for(db.session, 'before_flush')
+def maintain_term_balances(session, flush_context, instances):
+    """Fold every pending payment insert, edit or delete into the summary."""
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
@@ -0,0 +1,161 @@
+from app.models import db, Student, Fee, BusDestination, Grade, Term, Charge, BillingRun, StudentTermBalance
+from app.cache import fee_structure, bump_version, BILLING
+from app.balances import upsert_summary_stmt, summary_value
+from sqlalchemy import select, insert, update, delete, union_all, case, func, literal, or_
+
+TUITION = 'tuition'
+BOARDING = 'boarding'
+BUS = 'bus'
+FEE_KINDS = (TUITION, BOARDING)
+
+
+def boarding_grade_ids():
+    """Grades whose boarders pay the boarding surcharge."""
+    return [grade.id for grade in Grade.query.all() if grade.pays_boarding_fee]
+
+
+def tuition_charge(term_id):
+    """The term's fee for the student's grade, falling back to their current term fee."""
+    fee = (
+        select(Fee.amount)
+        .where(Fee.grade_id == Student.grade_id, Fee.term_id == term_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(fee, Student.term_fee)
+
+
+def boarding_charge(surcharge, grade_ids):
+    return case((Student.is_boarding & Student.grade_id.in_(grade_ids), surcharge), else_=0)
+
+
+def bus_charge():
+    """The charge for the student's destination, or NULL without one."""
+    return (
+        select(BusDestination.charge)
+        .where(BusDestination.id == Student.bus_destination_id)
+        .scalar_subquery()
+    )
+
+
+def _charged(term_id, kinds):
+    return func.coalesce(
+        select(func.sum(Charge.amount))
+        .where(Charge.student_id == Student.id, Charge.term_id == term_id, Charge.kind.in_(kinds))
+        .scalar_subquery(),
+        0,
+    )
+
+
+def run_term_billing(term_id, progress=None):
+    """
+    Bill every active student for a term in one transaction of set-based
+    statements: one tuition charge per student from Fee, a boarding charge for
+    boarders in grades that pay it and a bus charge for riders with a
+    destination.
+
+    The term's charges for active students are replaced, then balances move by
+    the difference between the new charges and what the term had already
+    billed (student_term_balance.billed and bus_billed), so billing a term the
+    rollover has opened, or billing it twice, never charges anyone twice. A
+    term billed before the rollover reaches it is netted out by the rollover.
+
+    Returns the BillingRun totals, or None if the term does not exist.
+    progress(rows_processed, total_rows) is called once the run has committed.
+    """
+    if not db.session.get(Term, term_id):
+        return None
+
+    surcharge = fee_structure().boarding_surcharge
+    grade_ids = boarding_grade_ids()
+    active = Student.is_active.is_(True)
+
+    try:
+        run = BillingRun(term_id=term_id)
+        db.session.add(run)
+        db.session.flush()
+
+        db.session.execute(
+            delete(Charge)
+            .where(Charge.term_id == term_id, Charge.student_id.in_(select(Student.id).where(active)))
+            .execution_options(synchronize_session=False)
+        )
+
+        def charges(kind, amount):
+            return select(Student.id, literal(term_id), literal(kind), amount, literal(run.id))
+
+        items = [charges(TUITION, tuition_charge(term_id)).where(active)]
+        if surcharge:
+            items.append(charges(BOARDING, literal(surcharge)).where(
+                active, Student.is_boarding.is_(True), Student.grade_id.in_(grade_ids)))
+        items.append(
+            charges(BUS, BusDestination.charge)
+            .join(BusDestination, BusDestination.id == Student.bus_destination_id)
+            .where(active, Student.use_bus.is_(True))
+        )
+        db.session.execute(insert(Charge).from_select(
+            ['student_id', 'term_id', 'kind', 'amount', 'billing_run_id'], union_all(*items)))
+
+        fee_delta = _charged(term_id, FEE_KINDS) - summary_value(term_id, StudentTermBalance.billed)
+        bus_delta = _charged(term_id, (BUS,)) - summary_value(term_id, StudentTermBalance.bus_billed)
+        adjustment = db.session.execute(
+            select(func.coalesce(func.sum(fee_delta + bus_delta), 0)).where(active)
+        ).scalar()
+        db.session.execute(
+            update(Student)
+            .where(active, or_(fee_delta != 0, bus_delta != 0))
+            .values(
+                balance=func.coalesce(Student.balance, 0) + fee_delta,
+                bus_balance=func.coalesce(Student.bus_balance, 0) + bus_delta,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        # The term summary now records exactly what these charges billed
+        db.session.execute(upsert_summary_stmt(
+            db.engine.dialect.name,
+            select(
+                Charge.student_id,
+                literal(term_id),
+                func.sum(case((Charge.kind.in_(FEE_KINDS), Charge.amount), else_=0)),
+                func.sum(case((Charge.kind == BUS, Charge.amount), else_=0)),
+            )
+            .where(Charge.billing_run_id == run.id)
+            .group_by(Charge.student_id),
+            ['student_id', 'term_id', 'billed', 'bus_billed'],
+            {'billed': 'set', 'bus_billed': 'set'},
+        ))
+
+        totals = {kind: (count, amount) for kind, count, amount in db.session.execute(
+            select(Charge.kind, func.count(Charge.id), func.sum(Charge.amount))
+            .where(Charge.billing_run_id == run.id)
+            .group_by(Charge.kind)
+        )}
+        run.students_billed = totals.get(TUITION, (0, 0))[0]
+        run.charge_count = sum(count for count, _ in totals.values())
+        run.tuition_total = totals.get(TUITION, (0, 0))[1]
+        run.boarding_total = totals.get(BOARDING, (0, 0))[1]
+        run.bus_total = totals.get(BUS, (0, 0))[1]
+        run.total = run.tuition_total + run.boarding_total + run.bus_total
+        run.balance_adjustment = adjustment
+        bump_version(BILLING)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if progress:
+        progress(run.students_billed, run.students_billed)
+    return run.to_dict()
+
+
+def charge_totals(term_id, billing_run_id=None):
+    """Recount a term's charge rows by kind, optionally for one billing run."""
+    query = (
+        select(Charge.kind, func.count(Charge.id), func.sum(Charge.amount))
+        .where(Charge.term_id == term_id)
+        .group_by(Charge.kind)
+    )
+    if billing_run_id is not None:
+        query = query.where(Charge.billing_run_id == billing_run_id)
+    return {kind: {"charges": count, "amount": amount} for kind, count, amount in db.session.execute(query)}
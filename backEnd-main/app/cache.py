@@ -0,0 +1,156 @@
+from app.models import db, Fee, BoardingFee, ChangeCounter
+from flask import g, current_app, request, Response
+from functools import wraps
+from sqlalchemy import event, insert, select
+from sqlalchemy.dialects import sqlite, postgresql
+import secrets
+import threading
+import zlib
+
+FEES = 'fee'
+TERMS = 'term'
+GRADES = 'grade'
+NOTIFICATIONS = 'notification'
+# Anything that changes what students were billed or how they group, apart from new payments
+BILLING = 'billing'
+# Bus payments and route assignments
+BUS = 'bus'
+# Not a counter: a random value picked when the counters table is created, so
+# ETags from a recreated database never match ones issued before it
+EPOCH = 'epoch'
+
+_upsert_dialects = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def bump_version(name):
+    """
+    Mark a table as changed. Call inside the writing transaction so the new
+    version becomes visible to other workers exactly when the write does.
+    A single upsert, so two workers bumping a new counter at once both count.
+    """
+    table = ChangeCounter.__table__
+    stmt = _upsert_dialects[db.session.get_bind().dialect.name](table).values(name=name, version=1)
+    db.session.execute(
+        stmt.on_conflict_do_update(index_elements=[table.c.name], set_={'version': table.c.version + 1})
+    )
+    g.pop('change_versions', None)
+
+
+def new_epoch():
+    return secrets.randbits(31)
+
+
+@event.listens_for(ChangeCounter.__table__, 'after_create')
+def _seed_epoch(table, connection, **kw):
+    connection.execute(insert(table).values(name=EPOCH, version=new_epoch()))
+
+
+def _change_versions():
+    """Every change counter, read in one query once per request."""
+    if 'change_versions' not in g:
+        g.change_versions = dict(db.session.execute(select(ChangeCounter.name, ChangeCounter.version)).all())
+    return g.change_versions
+
+
+def current_version(name):
+    """A change counter as of this request; missing counters are version 0."""
+    return _change_versions().get(name, 0)
+
+
+class FeeStructure:
+    """Immutable snapshot of the fee matrix and boarding surcharge."""
+
+    def __init__(self, version, rows, boarding_surcharge):
+        self.version = version
+        self.rows = rows
+        self.boarding_surcharge = boarding_surcharge
+        self.amounts = {(row['term_id'], row['grade_id']): row for row in rows}
+        # First fee per grade, which is what initialize_balance has always billed
+        self.by_grade = {}
+        for row in rows:
+            self.by_grade.setdefault(row['grade_id'], row['amount'])
+
+    def fee(self, grade_id, term_id):
+        return self.amounts.get((term_id, grade_id))
+
+    def grade_fee(self, grade_id, term_id=None):
+        if term_id is None:
+            return self.by_grade.get(grade_id)
+        row = self.fee(grade_id, term_id)
+        return row['amount'] if row else None
+
+    def opening_fee(self, grade_id, term_id=None):
+        """What a new student is billed: the term's fee for their grade, else the grade's first fee."""
+        amount = self.grade_fee(grade_id, term_id) if term_id is not None else None
+        return amount if amount is not None else self.by_grade.get(grade_id)
+
+
+_fee_lock = threading.Lock()
+
+
+def fee_structure():
+    """
+    Return this app's cached fee structure, reloading it when another worker
+    (or this one) has bumped the fee version since it was loaded.
+    """
+    version = current_version(FEES)
+    cached = current_app.extensions.get('fee_structure')
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _fee_lock:
+        cached = current_app.extensions.get('fee_structure')
+        if cached is None or cached.version != version:
+            rows = [fee.to_dict() for fee in Fee.query.order_by(Fee.id)]
+            boarding_fee = BoardingFee.query.first()
+            surcharge = boarding_fee.extra_fee if boarding_fee else 0
+            cached = current_app.extensions['fee_structure'] = FeeStructure(version, rows, surcharge)
+        return cached
+
+
+RENDERED_CACHE_SIZE = 256
+
+
+def versioned_response(*tables, vary=None):
+    """
+    Serve a read-mostly GET view from a rendered-body cache keyed by the
+    tables' change counters. The counters, prefixed with the database's
+    epoch, double as a strong ETag, so a matching If-None-Match gets a 304
+    without loading any rows. Writers
+    invalidate both simply by calling bump_version(table).
+
+    vary is an optional callable for anything else the response depends on
+    that no counter tracks, such as a term resolved from today's date; its
+    result joins the cache key and the ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            epoch = current_version(EPOCH)
+            version = (epoch,) + tuple(current_version(table) for table in tables)
+            varies = (vary(),) if vary else ()
+            key = (request.endpoint, request.full_path) + varies
+            tag = "-".join(f"{table}-{table_version}" for table, table_version in zip(tables, version[1:]))
+            etag = f"{epoch:08x}-{tag}-{zlib.crc32(repr((request.full_path,) + varies).encode()):08x}"
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            rendered = current_app.extensions.setdefault('rendered_responses', {})
+            cached = rendered.get(key)
+            if cached is None or cached[0] != version:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if len(rendered) >= RENDERED_CACHE_SIZE:
+                    rendered.clear()
+                cached = rendered[key] = (version, response.get_data(), response.mimetype)
+
+            response = Response(cached[1], mimetype=cached[2])
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
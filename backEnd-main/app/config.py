@@ -1,5 +1,54 @@
+import os
+
+
+def _env_str(name, default):
+    """An environment setting; empty values count as unset, as deployment tools often leave them."""
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+
+def _env_int(name, default):
+    value = _env_str(name, None)
+    return int(value) if value is not None else default
+
+
+def _database_url():
+    url = _env_str('DATABASE_URL', 'sqlite:///xyzyy.db')
+    # Hosting platforms still hand out the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///xyzyy.db'
+    SQLALCHEMY_DATABASE_URI = _database_url()  # postgresql:// URLs need the psycopg driver installed
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Applied to every SQLite connection (see app/database.py); WAL lets readers run alongside a writer
+    SQLITE_JOURNAL_MODE = _env_str('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = _env_str('SQLITE_SYNCHRONOUS', 'NORMAL')  # Durable in WAL bar the last commits on power loss
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_MMAP_SIZE = _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    # Connection pool per process for server databases such as PostgreSQL
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)  # Seconds; stays under server and proxy idle cut-offs
+    METRICS_ENABLED = True  # Request latency / SQL histograms served on /metrics
+    QUERY_WATCH = False  # Dev/test: report N+1 patterns and enforce route query budgets
+    QUERY_REPEAT_THRESHOLD = 5
+    # SSE clients reconnect with Last-Event-ID after this. Each open stream holds a worker thread
+    # for that long, so serve the app with threaded or gevent workers (see procfile), not sync ones
+    NOTIFICATION_STREAM_SECONDS = 300
+    # Open streams per worker process before new ones get a 503; keep it below the procfile's
+    # --threads so ordinary requests always find a free thread
+    NOTIFICATION_STREAM_MAX_CLIENTS = _env_int('NOTIFICATION_STREAM_MAX_CLIENTS', 8)
+    NOTIFICATION_POLL_SECONDS = 15  # Catch-up interval for notifications posted by other workers
+    ROLLOVER_CHUNK_SIZE = 2000  # Students per rollover transaction; writers interleave between chunks
+    JOB_HEARTBEAT_SECONDS = 10  # How often a worker marks its running job as alive
+    JOB_STALE_SECONDS = 60  # A running job without a heartbeat for this long is recovered by another worker
+    DASHBOARD_MAX_AGE_SECONDS = 600  # Full rebuild interval for the cached finance dashboard
+    GROUP_COMMIT = False  # Coalesce concurrent POST /payments and /bus-payments into shared commits
+    GROUP_COMMIT_WINDOW_MS = 3  # How long the first writer waits for others to join its commit
+    GROUP_COMMIT_MAX_BATCH = 64
     SECRET_KEY = '5e3d7f9b3e8c1d6f0a8b3c7d6e4f1a5c'  # Example secret key
 
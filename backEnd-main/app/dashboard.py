@@ -0,0 +1,191 @@
+from app.models import db, Payment, BusPayment, Student, StudentTermBalance, Grade, BusDestination
+from app.cache import current_version, fee_structure, BILLING, GRADES
+from flask import current_app
+from sqlalchemy import select, func, case, and_, or_
+import threading
+import time
+
+# Figures summed per (grade, boarding, destination) cell
+CELL_COLUMNS = ('students', 'arrears_brought_forward', 'billed', 'bus_billed',
+                'collected', 'payment_count', 'bus_collected')
+
+_dashboard_lock = threading.Lock()
+
+
+def _ledger_marks():
+    """Highest Payment and BusPayment ids committed so far."""
+    return tuple(db.session.execute(select(
+        select(func.coalesce(func.max(Payment.id), 0)).scalar_subquery(),
+        select(func.coalesce(func.max(BusPayment.id), 0)).scalar_subquery(),
+    )).one())
+
+
+class TermDashboard:
+    """
+    Finance aggregates for one term, kept per (grade, boarding, destination)
+    cell and per payment method. Enrolment comes from active students and
+    billing figures from the term's student_term_balance rows; collections are summed from the payment
+    ledgers up to the recorded high-water marks, so newly posted payments are
+    folded in by aggregating only the rows above them.
+    """
+
+    def __init__(self, term_id, version):
+        self.term_id = term_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.payment_mark = 0
+        self.bus_payment_mark = 0
+        self.cells = {}
+        self.methods = {}
+        self.grade_names = {}
+        self.destination_names = {}
+
+    def cell(self, grade_id, is_boarding, destination_id):
+        key = (grade_id, bool(is_boarding), destination_id)
+        if key not in self.cells:
+            self.cells[key] = dict.fromkeys(CELL_COLUMNS, 0)
+        return self.cells[key]
+
+    def load_billing(self):
+        self.grade_names = dict(db.session.execute(select(Grade.id, Grade.name)).all())
+        self.destination_names = dict(db.session.execute(select(BusDestination.id, BusDestination.name)).all())
+        # Active students are counted even before they have a row for the term;
+        # former students still contribute whatever the term billed them
+        for row in db.session.execute(
+            select(
+                Student.grade_id, Student.is_boarding, Student.bus_destination_id,
+                func.sum(case((Student.is_active.is_(True), 1), else_=0)),
+                func.coalesce(func.sum(StudentTermBalance.arrears_brought_forward), 0),
+                func.coalesce(func.sum(StudentTermBalance.billed), 0),
+                func.coalesce(func.sum(StudentTermBalance.bus_billed), 0),
+            )
+            .outerjoin(StudentTermBalance, and_(StudentTermBalance.student_id == Student.id,
+                                                StudentTermBalance.term_id == self.term_id))
+            .where(or_(Student.is_active.is_(True), StudentTermBalance.student_id.is_not(None)))
+            .group_by(Student.grade_id, Student.is_boarding, Student.bus_destination_id)
+        ):
+            cell = self.cell(*row[:3])
+            cell['students'], cell['arrears_brought_forward'], cell['billed'], cell['bus_billed'] = row[3:]
+
+    def fold_ledgers(self, payment_mark, bus_payment_mark):
+        """
+        Add payments with ids in (current mark, new mark] for this term. After
+        the first load the id range alone is the selective predicate, so the
+        term is picked out of the grouped rows rather than the WHERE clause.
+        """
+        if payment_mark > self.payment_mark:
+            conditions = [Payment.id > self.payment_mark, Payment.id <= payment_mark]
+            if not self.payment_mark:
+                conditions.append(Payment.term_id == str(self.term_id))
+            for term_id, grade_id, is_boarding, destination_id, method, count, amount in db.session.execute(
+                select(Payment.term_id, Student.grade_id, Student.is_boarding, Student.bus_destination_id,
+                       Payment.method, func.count(Payment.id), func.sum(Payment.amount))
+                .join(Student, Student.id == Payment.student_id)
+                .where(*conditions)
+                .group_by(Payment.term_id, Student.grade_id, Student.is_boarding, Student.bus_destination_id,
+                          Payment.method)
+            ):
+                if str(term_id) != str(self.term_id):
+                    continue
+                cell = self.cell(grade_id, is_boarding, destination_id)
+                cell['collected'] += amount
+                cell['payment_count'] += count
+                totals = self.methods.setdefault(method, {"payments": 0, "amount": 0})
+                totals['payments'] += count
+                totals['amount'] += amount
+            self.payment_mark = payment_mark
+
+        if bus_payment_mark > self.bus_payment_mark:
+            conditions = [BusPayment.id > self.bus_payment_mark, BusPayment.id <= bus_payment_mark]
+            if not self.bus_payment_mark:
+                conditions.append(BusPayment.term_id == self.term_id)
+            for term_id, grade_id, is_boarding, destination_id, amount in db.session.execute(
+                select(BusPayment.term_id, Student.grade_id, Student.is_boarding, Student.bus_destination_id,
+                       func.sum(BusPayment.amount))
+                .join(Student, Student.id == BusPayment.student_id)
+                .where(*conditions)
+                .group_by(BusPayment.term_id, Student.grade_id, Student.is_boarding, Student.bus_destination_id)
+            ):
+                if term_id == self.term_id:
+                    self.cell(grade_id, is_boarding, destination_id)['bus_collected'] += amount
+            self.bus_payment_mark = bus_payment_mark
+
+    def _rollup(self, key):
+        groups = {}
+        for cell_key, cell in self.cells.items():
+            group = groups.setdefault(key(cell_key), dict.fromkeys(CELL_COLUMNS, 0))
+            for column in CELL_COLUMNS:
+                group[column] += cell[column]
+        return groups
+
+    def to_dict(self, fees):
+        def figures(group):
+            return {
+                "students": group['students'],
+                "arrears_brought_forward": group['arrears_brought_forward'],
+                "billed": group['billed'],
+                "collected": group['collected'],
+                "outstanding": group['arrears_brought_forward'] + group['billed'] - group['collected'],
+                "payment_count": group['payment_count'],
+            }
+
+        def bus_figures(group):
+            return {
+                "bus_billed": group['bus_billed'],
+                "bus_collected": group['bus_collected'],
+                "bus_outstanding": group['bus_billed'] - group['bus_collected'],
+            }
+
+        totals = self._rollup(lambda key: None).get(None, dict.fromkeys(CELL_COLUMNS, 0))
+        by_grade = self._rollup(lambda key: key[0])
+        by_boarding = self._rollup(lambda key: key[1])
+        by_destination = self._rollup(lambda key: key[2])
+        return {
+            "term_id": self.term_id,
+            "as_of_payment_id": self.payment_mark,
+            "as_of_bus_payment_id": self.bus_payment_mark,
+            "totals": dict(figures(totals), **bus_figures(totals)),
+            "collections_by_method": [
+                dict(method=method, **totals) for method, totals in sorted(self.methods.items())
+            ],
+            "by_grade": [
+                dict(grade_id=grade_id, grade=self.grade_names.get(grade_id),
+                     term_fee=fees.grade_fee(grade_id, self.term_id), **figures(group))
+                for grade_id, group in sorted(by_grade.items(), key=lambda item: item[0] or 0)
+            ],
+            "boarding_vs_day": [
+                dict(boarding=is_boarding, **figures(group))
+                for is_boarding, group in sorted(by_boarding.items())
+            ],
+            "bus_by_destination": [
+                dict(destination_id=destination_id, destination=self.destination_names.get(destination_id),
+                     **bus_figures(group))
+                for destination_id, group in sorted(by_destination.items(), key=lambda item: item[0] or 0)
+                if destination_id is not None
+            ],
+        }
+
+
+def finance_dashboard(term_id):
+    """
+    Return the finance aggregates for a term from this app's cache.
+
+    The cache is rebuilt when the billing or grade change counter moves (new
+    or edited students, rollovers, promotions, edited or deleted payments) or
+    after DASHBOARD_MAX_AGE_SECONDS. In between, payments posted since the
+    last read are aggregated on their own and added in. Payment ids commit in
+    order on SQLite; on other backends the periodic rebuild picks up any
+    transaction that committed out of id order.
+    """
+    version = (current_version(BILLING), current_version(GRADES))
+    max_age = current_app.config['DASHBOARD_MAX_AGE_SECONDS']
+    cache = current_app.extensions.setdefault('finance_dashboard', {})
+
+    with _dashboard_lock:
+        marks = _ledger_marks()
+        dashboard = cache.get(term_id)
+        if dashboard is None or dashboard.version != version or time.monotonic() - dashboard.loaded_at > max_age:
+            dashboard = cache[term_id] = TermDashboard(term_id, version)
+            dashboard.load_billing()
+        dashboard.fold_ledgers(*marks)
+        return dashboard.to_dict(fee_structure())
@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config):
+    """
+    Engine options for the configured database. Server databases get a sized
+    QueuePool that pings connections before use and recycles them before
+    idle cut-offs; SQLite keeps Flask-SQLAlchemy's pool defaults. Anything in
+    SQLALCHEMY_ENGINE_OPTIONS wins.
+    """
+    options = {}
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=True,
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def sqlite_pragmas(config):
+    """The PRAGMAs run on every new SQLite connection; unset or empty settings are left at SQLite's defaults."""
+    settings = (
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS')),
+        ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS')),
+        ('mmap_size', config.get('SQLITE_MMAP_SIZE')),
+    )
+    return [f"PRAGMA {name} = {value}" for name, value in settings if value not in (None, '')]
+
+
+def init_app(app, db):
+    """
+    Tune SQLite per connection: journal mode and synchronous level trade
+    durability of the last commits for write throughput, the busy timeout
+    makes writers queue instead of failing, and mmap serves reads from the
+    page cache without copying.
+    """
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        pragmas = sqlite_pragmas(app.config)
+
+        def on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        event.listen(db.engine, "connect", on_connect)
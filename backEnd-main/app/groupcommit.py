@@ -0,0 +1,134 @@
+from flask import current_app, g
+from app.models import db
+from app.querywatch import statements_for
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_committer_lock = threading.Lock()
+
+
+class _Pending:
+    __slots__ = ('write', 'owner', 'done', 'result', 'error')
+
+    def __init__(self, write):
+        self.write = write
+        # The submitting request, which the write's SQL is charged to
+        self.owner = g._get_current_object()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """
+    Coalesce concurrent writes from one process into a single transaction.
+
+    The first request to arrive becomes the leader: it waits up to `window`
+    seconds (or until `max_batch` writes are queued), runs every queued write
+    on its own session and commits once. The other requests block until their
+    write is committed and then return its result or raise its error.
+
+    A write is a callable that works on db.session without committing. It may
+    raise ValueError to reject itself, but only before it has written
+    anything, so the rest of the batch can still commit. Any other failure
+    rolls the batch back and replays each write in its own transaction, so
+    one bad write never fails its neighbours. Each write's SQL is counted
+    against the request that submitted it in the metrics and query budgets;
+    the shared flush and commit are counted against the leader's.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        # Held while a batch runs, so the next leader keeps collecting meanwhile
+        self.commit_lock = threading.Lock()
+        self.batch_full = threading.Event()
+        self.pending = []
+        self.leader_waiting = False
+
+    def submit(self, write):
+        item = _Pending(write)
+        with self.lock:
+            self.pending.append(item)
+            lead = not self.leader_waiting
+            if lead:
+                self.leader_waiting = True
+            elif len(self.pending) >= self.max_batch:
+                self.batch_full.set()
+
+        if lead:
+            self.batch_full.wait(self.window)
+            with self.commit_lock:
+                with self.lock:
+                    batch, self.pending = self.pending, []
+                    self.leader_waiting = False
+                    self.batch_full.clear()
+                self._commit(batch)
+        else:
+            item.done.wait()
+
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _commit(self, batch):
+        try:
+            for item in batch:
+                try:
+                    with statements_for(item.owner):
+                        item.result = item.write()
+                except ValueError as e:
+                    item.error = e
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.warning("Group commit of %d writes failed; retrying them one by one", len(batch), exc_info=True)
+            self._commit_each(batch)
+        finally:
+            for item in batch:
+                item.done.set()
+
+    def _commit_each(self, batch):
+        for item in batch:
+            item.result = item.error = None
+            try:
+                with statements_for(item.owner):
+                    item.result = item.write()
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                item.error = e
+
+
+def _committer():
+    committer = current_app.extensions.get('group_commit')
+    if committer is None:
+        with _committer_lock:
+            committer = current_app.extensions.get('group_commit')
+            if committer is None:
+                committer = current_app.extensions['group_commit'] = GroupCommitter(
+                    current_app.config['GROUP_COMMIT_WINDOW_MS'] / 1000.0,
+                    current_app.config['GROUP_COMMIT_MAX_BATCH'],
+                )
+    return committer
+
+
+def commit_write(write):
+    """
+    Run `write` and commit it. With GROUP_COMMIT enabled the commit is shared
+    with other requests that arrive within the window; otherwise every call
+    commits on its own. Either way the caller gets its own result or error.
+    """
+    if current_app.config['GROUP_COMMIT']:
+        return _committer().submit(write)
+
+    try:
+        result = write()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
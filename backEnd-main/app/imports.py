@@ -0,0 +1,151 @@
+from app.models import db, Student, Grade, Term
+from app.cache import fee_structure, bump_version, BILLING
+from app.balances import open_term_summaries
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+import threading
+
+INSERT_BATCH_SIZE = 500
+# Below this many rows the process pool costs more than it saves
+POOL_THRESHOLD = 32
+REQUIRED_FIELDS = ['name', 'admission_number', 'grade_id', 'phone', 'use_bus']
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ('1', 'true', 'yes'):
+        return True
+    if str(value).strip().lower() in ('0', 'false', 'no', ''):
+        return False
+    raise ValueError(f"Invalid boolean value '{value}'")
+
+
+def _to_float(value, default=0.0):
+    if value in (None, ''):
+        return default
+    return float(value)
+
+
+def _hashing_pool():
+    """The process's hashing pool, started on first use and shared by every import."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor()
+    return _pool
+
+
+def hash_passwords(passwords):
+    """Hash passwords across a process pool; werkzeug hashing is deliberately slow."""
+    if len(passwords) < POOL_THRESHOLD:
+        return [generate_password_hash(password) for password in passwords]
+    return list(_hashing_pool().map(generate_password_hash, passwords, chunksize=64))
+
+
+def opening_fee_table(term_id=None):
+    """
+    Snapshot the grade -> term fee map once per import. Without a term this
+    matches Student.initialize_balance: the billing term's fee for each grade,
+    else the grade's first fee.
+    """
+    fees = fee_structure()
+    if term_id is None:
+        billing_term = Term.billing_id()
+        return {grade_id: fees.opening_fee(grade_id, billing_term) for grade_id in fees.by_grade}
+    return {grade_id: row['amount'] for (fee_term_id, grade_id), row in fees.amounts.items()
+            if fee_term_id == term_id}
+
+
+def import_students(rows, term_id=None):
+    """
+    Validate and insert a batch of students. Opening balances are calculated
+    from a preloaded fee table, rows are inserted in executemany chunks and
+    the billed term (term_id, else Term.billing_id()) gets their summary rows.
+
+    Returns (created, errors) where errors lists the rejected rows by index;
+    one bad row never aborts the rest of the batch.
+    """
+    fees = opening_fee_table(term_id)
+    surcharge = fee_structure().boarding_surcharge
+    grades = {grade.id: grade for grade in Grade.query.all()}
+
+    admission_numbers = [str(row.get('admission_number', '')).strip() if isinstance(row, dict) else ''
+                         for row in rows]
+    existing = set()
+    for start in range(0, len(admission_numbers), INSERT_BATCH_SIZE):
+        chunk = admission_numbers[start:start + INSERT_BATCH_SIZE]
+        existing.update(db.session.execute(
+            select(Student.admission_number).where(Student.admission_number.in_(chunk))
+        ).scalars())
+
+    errors = []
+    seen = set()
+    students = []
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("Student must be an object")
+            missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+            if missing:
+                raise ValueError(f"{', '.join(missing)} is required")
+
+            admission_number = admission_numbers[index]
+            if admission_number in existing or admission_number in seen:
+                raise ValueError("Admission number must be unique")
+
+            grade = grades.get(int(row['grade_id']))
+            if not grade:
+                raise ValueError("Invalid grade ID")
+            if grade.id not in fees:
+                raise ValueError("Fee structure not set for this grade.")
+
+            is_boarding = _to_bool(row.get('is_boarding', False))
+            arrears = _to_float(row.get('arrears'))
+            term_fee = _to_float(row.get('term_fee'), fees[grade.id])
+            balance = fees[grade.id] + arrears
+            if is_boarding and grade.pays_boarding_fee:
+                balance += surcharge
+
+            students.append({
+                "name": str(row['name']).strip(),
+                "admission_number": admission_number,
+                "grade_id": grade.id,
+                "phone": str(row['phone']).strip(),
+                "term_fee": term_fee,
+                "use_bus": _to_bool(row['use_bus']),
+                "is_boarding": is_boarding,
+                "arrears": arrears,
+                "bus_balance": _to_float(row.get('bus_balance')),
+                "balance": balance,
+            })
+            seen.add(admission_number)
+        except (ValueError, TypeError) as e:
+            errors.append({"row": index, "error": str(e)})
+
+    # Passwords default to the admission number, as in add_student
+    hashes = hash_passwords([student['admission_number'] for student in students])
+    for student, password in zip(students, hashes):
+        student['password'] = password
+
+    summary_term = term_id if term_id is not None else Term.billing_id()
+    try:
+        for start in range(0, len(students), INSERT_BATCH_SIZE):
+            chunk = students[start:start + INSERT_BATCH_SIZE]
+            db.session.execute(insert(Student), chunk)
+            if summary_term is not None:
+                open_term_summaries(db.session, summary_term, Student.admission_number.in_(
+                    [student['admission_number'] for student in chunk]))
+        if students:
+            bump_version(BILLING)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(students), errors
@@ -0,0 +1,196 @@
+from app.models import db, Job
+from app.jobs import process_term_rollover, promote_students
+from app.billing import run_term_billing
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, or_
+from sqlalchemy.exc import IntegrityError
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+# kind -> (job function, error recorded when it returns None)
+HANDLERS = {
+    'term_rollover': (process_term_rollover, "No term found to process rollover"),
+    'promote_students': (promote_students, "Nothing to promote"),
+    'term_billing': (run_term_billing, "Term not found"),
+}
+# Kinds that checkpoint their own progress and can simply be run again
+RESUMABLE = ('term_rollover',)
+
+
+def enqueue(kind, **params):
+    """
+    Queue a job unless one of the same kind is already queued or running.
+    Returns (job, created).
+
+    The partial unique index on active jobs settles concurrent enqueues: the
+    loser's insert fails and it returns the winner's job instead.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    existing = _active_job(kind)
+    if existing:
+        return existing, False
+
+    job = Job(kind=kind, params=json.dumps(params))
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = _active_job(kind)
+        if existing is None:
+            # The job that beat us has already finished
+            return enqueue(kind, **params)
+        return existing, False
+    return job, True
+
+
+def _active_job(kind):
+    return Job.query.filter(Job.kind == kind, Job.status.in_(ACTIVE_STATUSES)).first()
+
+
+def worker_identity():
+    """A name for this worker process, unique across hosts and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_next(worker_id=None):
+    """
+    Atomically mark the oldest queued job as running and owned by worker_id.
+    The partial unique index on running jobs makes this fail while another
+    job is still running.
+    """
+    oldest = select(Job.id).where(Job.status == 'queued').order_by(Job.id).limit(1).scalar_subquery()
+    now = datetime.utcnow()
+    try:
+        job_id = db.session.execute(
+            update(Job)
+            .where(Job.id == oldest, Job.status == 'queued')
+            .values(status='running', started_at=now, worker_id=worker_id, heartbeat_at=now)
+            .returning(Job.id)
+        ).scalar()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return db.session.get(Job, job_id) if job_id else None
+
+
+def progress_reporter(job_id):
+    """
+    Progress callback handed to job functions. It writes on its own connection
+    so readers see it straight away; call it between commits, never while the
+    job holds SQLite's write lock.
+    """
+    def report(rows_processed, total_rows=None):
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Job.__table__)
+                .where(Job.__table__.c.id == job_id)
+                .values(rows_processed=rows_processed, total_rows=total_rows, heartbeat_at=datetime.utcnow())
+            )
+    return report
+
+
+@contextmanager
+def heartbeat(job_id, worker_id, interval):
+    """
+    Refresh the job's heartbeat from a background thread while the block
+    runs, so other workers can tell a long job from one whose worker died.
+    """
+    engine = db.engine
+    table = Job.__table__
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(table)
+                        .where(table.c.id == job_id, table.c.worker_id == worker_id)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except Exception:
+                logger.warning("Heartbeat for job %s failed", job_id, exc_info=True)
+
+    thread = threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    function, empty_message = HANDLERS[job.kind]
+    params = json.loads(job.params)
+    try:
+        with heartbeat(job.id, job.worker_id, current_app.config['JOB_HEARTBEAT_SECONDS']):
+            result = function(progress=progress_reporter(job.id), **params)
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Job %s (%s) failed: %s", job.id, job.kind, traceback.format_exc())
+        job.status, job.error = 'failed', str(e)
+    else:
+        if result is None:
+            job.status, job.error = 'failed', empty_message
+        else:
+            job.status, job.result = 'succeeded', json.dumps(result, default=str)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def recover_interrupted(stale_after):
+    """
+    Deal with jobs left running by a worker that died mid-run, i.e. whose
+    heartbeat is older than stale_after seconds: resumable kinds go back on
+    the queue, anything else is failed. Jobs of live workers are left alone.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = (Job.status == 'running', or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < cutoff))
+    db.session.execute(
+        update(Job)
+        .where(*stale, Job.kind.in_(RESUMABLE))
+        .values(status='queued', started_at=None, worker_id=None, heartbeat_at=None)
+    )
+    db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status='failed', error='Worker stopped before the job finished', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def run_forever(app, poll_interval=1.0):
+    """
+    Worker loop: run queued jobs one at a time, each in a fresh app context.
+    Several workers may share the queue; between jobs each one recovers jobs
+    whose worker has stopped sending heartbeats.
+    """
+    worker_id = worker_identity()
+    next_recovery = 0.0
+    while True:
+        with app.app_context():
+            if time.monotonic() >= next_recovery:
+                recover_interrupted(app.config['JOB_STALE_SECONDS'])
+                next_recovery = time.monotonic() + app.config['JOB_HEARTBEAT_SECONDS']
+            job = claim_next(worker_id)
+            if job:
+                logger.info("Running job %s (%s)", job.id, job.kind)
+                run_job(job)
+                continue
+        time.sleep(poll_interval)
@@ -1,69 +1,259 @@
-from app.models import db, Student, Fee, BusPayment, Term
+from app.models import db, Student, Grade, Term, RolloverCheckpoint, StudentTermBalance
+from app.cache import fee_structure, bump_version, BILLING
+from app.balances import upsert_summary_stmt
+from app.billing import boarding_grade_ids, tuition_charge, boarding_charge, bus_charge
 from datetime import datetime
+from flask import current_app
+from sqlalchemy import update, select, case, func, literal
 
-def process_term_rollover():
-    # Fetch the current term
-    current_term = Term.query.filter_by(end_date__lt=datetime.now()).order_by(Term.end_date.desc()).first()
-    
-    if current_term:
-        # Update student balances for bus and fees after the current term ends
-        students = Student.query.all()
-        for student in students:
-            # Update fee arrears
-            fee_balance = Fee.query.filter_by(student_id=student.id).first()
-            if fee_balance:
-                fee_balance.arrears += fee_balance.amount_due
-                fee_balance.amount_due = current_term.fee  # Set the new fee for the next term
-                
-            # Update bus payment arrears
-            bus_payment_balance = BusPayment.query.filter_by(student_id=student.id).first()
-            if bus_payment_balance:
-                bus_payment_balance.arrears += bus_payment_balance.amount_due
-                bus_payment_balance.amount_due = current_term.bus_fee  # Set new bus fee for the next term
-            
+
+def _next_chunk_end(after_id, max_id, chunk_size):
+    """Id of the chunk_size-th student after after_id, capped at max_id."""
+    upper = db.session.execute(
+        select(Student.id)
+        .where(Student.id > after_id, Student.id <= max_id)
+        .order_by(Student.id)
+        .offset(chunk_size - 1)
+        .limit(1)
+    ).scalar()
+    return upper or max_id
+
+
+def _already_billed(term_id, column):
+    """
+    What the student's summary row for the term has billed, or NULL when it
+    has billed nothing; a row opened by an early payment bills nothing yet.
+    """
+    return func.nullif(
+        select(column)
+        .where(StudentTermBalance.student_id == Student.id, StudentTermBalance.term_id == term_id)
+        .scalar_subquery(),
+        0,
+    )
+
+
+def _open_checkpoint(current_term, next_term):
+    checkpoint = db.session.get(RolloverCheckpoint, next_term.id)
+    if checkpoint:
+        return checkpoint
+
+    checkpoint = RolloverCheckpoint(
+        to_term_id=next_term.id,
+        from_term_id=current_term.id,
+        last_student_id=0,
+        max_student_id=db.session.execute(select(func.coalesce(func.max(Student.id), 0))).scalar(),
+        total_students=db.session.execute(
+            select(func.count(Student.id)).where(Student.is_active.is_(True))
+        ).scalar(),
+    )
+    db.session.add(checkpoint)
+    db.session.commit()
+    return checkpoint
+
+
+def process_term_rollover(progress=None, chunk_size=None):
+    """
+    Roll every student over from the term that has just ended into the next one.
+
+    Outstanding balances become arrears, prepayments are cleared, the next
+    term's fee (plus the boarding surcharge) is billed and bus balances pick up
+    the destination charge. The next term's student_term_balance rows are
+    opened with the same figures. A next term that billing.run_term_billing
+    has already billed keeps its charges: they are netted out of the balance
+    carried into arrears and not billed again.
+
+    Students are handled in id-ordered chunks of set-based statements, one
+    transaction per chunk, so payments can be posted between chunks. Each
+    chunk advances the term's RolloverCheckpoint in the same transaction: an
+    interrupted run resumes after the last committed student and a finished
+    one is never applied twice.
+
+    Returns a summary of the rows changed, or None if there is no ended term
+    with a following term to roll into. progress(rows_processed, total_rows)
+    is called after every chunk commits.
+    """
+    today = datetime.now().date()
+    current_term = Term.query.filter(Term.end_date < today).order_by(Term.end_date.desc()).first()
+    if not current_term:
+        return None
+
+    next_term = Term.query.filter(Term.start_date > current_term.end_date).order_by(Term.start_date).first()
+    if not next_term:
+        return None
+
+    checkpoint = _open_checkpoint(current_term, next_term)
+    if checkpoint.completed_at:
+        return checkpoint.summary()
+
+    chunk_size = chunk_size or current_app.config['ROLLOVER_CHUNK_SIZE']
+    surcharge = fee_structure().boarding_surcharge
+    grade_ids = boarding_grade_ids()
+
+    new_term_fee = tuition_charge(next_term.id)
+    boarding = boarding_charge(surcharge, grade_ids)
+    destination_charge = func.coalesce(bus_charge(), 0)
+    already_billed = _already_billed(next_term.id, StudentTermBalance.billed)
+    already_bus_billed = _already_billed(next_term.id, StudentTermBalance.bus_billed)
+    term_charge = func.coalesce(already_billed, new_term_fee + boarding)
+    next_term_bus = case((Student.use_bus.is_(True), func.coalesce(already_bus_billed, destination_charge)), else_=0)
+
+    # Whatever is still owed for earlier terms becomes arrears; credit balances are dropped
+    carried = Student.balance - func.coalesce(already_billed, 0)
+    outstanding = case((carried > 0, carried), else_=0)
+    bus_carried = Student.bus_balance - func.coalesce(already_bus_billed, 0)
+    bus_outstanding = case((bus_carried > 0, bus_carried), else_=0)
+
+    while checkpoint.last_student_id < checkpoint.max_student_id:
+        lower = checkpoint.last_student_id
+        upper = _next_chunk_end(lower, checkpoint.max_student_id, chunk_size)
+        in_chunk = (Student.id > lower, Student.id <= upper, Student.is_active.is_(True))
+
+        try:
+            prepayments = db.session.execute(
+                select(func.count(Student.id)).where(*in_chunk, carried < 0)
+            ).scalar()
+
+            # Students first, while the summary still shows what was billed before the rollover
+            fees_result = db.session.execute(
+                update(Student)
+                .where(*in_chunk)
+                .values(
+                    arrears=outstanding,
+                    term_fee=new_term_fee,
+                    balance=term_charge + outstanding,
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            bus_result = db.session.execute(
+                update(Student)
+                .where(*in_chunk, Student.use_bus.is_(True))
+                .values(bus_balance=bus_outstanding + next_term_bus)
+                .execution_options(synchronize_session=False)
+            )
+
+            # Then open the next term's summary rows; arrears is what was just carried over
+            db.session.execute(upsert_summary_stmt(
+                db.engine.dialect.name,
+                select(Student.id, literal(next_term.id), Student.arrears, term_charge, next_term_bus)
+                .where(*in_chunk),
+                ['student_id', 'term_id', 'arrears_brought_forward', 'billed', 'bus_billed'],
+                {'arrears_brought_forward': 'set', 'billed': 'set', 'bus_billed': 'set'},
+            ))
+
+            checkpoint.last_student_id = upper
+            checkpoint.students_rolled_over += fees_result.rowcount
+            checkpoint.bus_balances_rolled_over += bus_result.rowcount
+            checkpoint.prepayments_cleared += prepayments
+            bump_version(BILLING)
             db.session.commit()
-        
-        # Remove any prepayments (if student paid excess amount last term)
-        for student in students:
-            student_balance = Fee.query.filter_by(student_id=student.id).first()
-            if student_balance and student_balance.prepaid > 0:
-                student_balance.prepaid = 0
-                db.session.commit()
-
-        return True  # Return success status
-    else:
-        return False  # No term found to process rollover
-
-
-def promote_students():
-    # Logic for promoting students to the next class after the year ends
-    students = Student.query.all()
-    
-    for student in students:
-        # Check current grade and promote the student
-        if student.grade == 'baby':
-            student.grade = 'pp1'
-        elif student.grade == 'pp1':
-            student.grade = 'pp2'
-        elif student.grade == 'pp2':
-            student.grade = '1'
-        elif student.grade == '1':
-            student.grade = '2'
-        elif student.grade == '2':
-            student.grade = '3'
-        elif student.grade == '3':
-            student.grade = '4'
-        elif student.grade == '4':
-            student.grade = '5'
-        elif student.grade == '5':
-            student.grade = '6'
-        elif student.grade == '6':
-            student.grade = '7'
-        elif student.grade == '7':
-            student.grade = '8'
-        elif student.grade == '8':
-            student.grade = '9'
-        # Optionally add logic for handling cases when the student is in grade 9
-
-        db.session.commit()  # Save the changes for each student
-                
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if progress:
+            progress(checkpoint.students_rolled_over, checkpoint.total_students)
+
+    checkpoint.completed_at = datetime.utcnow()
+    db.session.commit()
+    return checkpoint.summary()
+
+
+def set_grade_progression(grade_names):
+    """
+    Persist the grade-progression map from an ordered list of grade names.
+    Each grade promotes into the one after it and the last grade graduates;
+    grades left out of the list are cleared, so the list replaces the old map.
+    """
+    if (not isinstance(grade_names, list) or not grade_names
+            or not all(isinstance(name, str) for name in grade_names)):
+        raise ValueError("An ordered list of grade names is required.")
+    if len(set(grade_names)) != len(grade_names):
+        raise ValueError("Each grade may appear only once in the progression.")
+
+    grades = {grade.name: grade for grade in Grade.query.all()}
+    missing = [name for name in grade_names if name not in grades]
+    if missing:
+        raise ValueError(f"Unknown grades: {', '.join(missing)}")
+
+    for name, grade in grades.items():
+        if name not in grade_names:
+            grade.next_grade_id = None
+            grade.graduating = False
+
+    for current_name, next_name in zip(grade_names, grade_names[1:]):
+        grades[current_name].next_grade_id = grades[next_name].id
+        grades[current_name].graduating = False
+
+    final_grade = grades[grade_names[-1]]
+    final_grade.next_grade_id = None
+    final_grade.graduating = True
+    db.session.commit()
+
+
+def promote_students(dry_run=False, progress=None):
+    """
+    Promote every active student to the next grade in the progression map and
+    graduate those in the final grade. All transitions are applied by one CASE
+    UPDATE plus one graduation UPDATE in a single transaction.
+
+    Returns the transitions with the number of students affected by each; with
+    dry_run=True nothing is written. progress(rows_processed, total_rows) is
+    called once the transaction has committed.
+    """
+    grades = Grade.query.all()
+    names = {grade.id: grade.name for grade in grades}
+    progression = {grade.id: grade.next_grade_id for grade in grades if grade.next_grade_id}
+    graduating_ids = [grade.id for grade in grades if grade.graduating]
+
+    counts = dict(db.session.execute(
+        select(Student.grade_id, func.count(Student.id))
+        .where(Student.is_active.is_(True))
+        .group_by(Student.grade_id)
+    ).all())
+
+    transitions = [
+        {"from": names[from_id], "to": names[to_id], "students": counts.get(from_id, 0)}
+        for from_id, to_id in progression.items()
+    ]
+    transitions += [
+        {"from": names[grade_id], "to": None, "students": counts.get(grade_id, 0)}
+        for grade_id in graduating_ids
+    ]
+    summary = {
+        "transitions": transitions,
+        "promoted": sum(counts.get(grade_id, 0) for grade_id in progression),
+        "graduated": sum(counts.get(grade_id, 0) for grade_id in graduating_ids),
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        return summary
+
+    try:
+        # Graduate first so the final grade is never confused with students
+        # who have just been promoted into it
+        if graduating_ids:
+            db.session.execute(
+                update(Student)
+                .where(Student.is_active.is_(True), Student.grade_id.in_(graduating_ids))
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+        if progression:
+            db.session.execute(
+                update(Student)
+                .where(Student.is_active.is_(True), Student.grade_id.in_(list(progression)))
+                .values(grade_id=case(progression, value=Student.grade_id, else_=Student.grade_id))
+                .execution_options(synchronize_session=False)
+            )
+        bump_version(BILLING)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if progress:
+        total = summary["promoted"] + summary["graduated"]
+        progress(total, total)
+
+    return summary
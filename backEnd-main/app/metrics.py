@@ -0,0 +1,146 @@
+from flask import g, request, Response, has_request_context
+from sqlalchemy import event
+from app.querywatch import statement_owner
+import bisect
+import inspect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a fixed set of labels."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Wall time per request.", LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements executed per request.", SQL_COUNT_BUCKETS)
+SQL_DURATION = Histogram("http_request_sql_duration_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size.", SIZE_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, SQL_STATEMENTS, SQL_DURATION, RESPONSE_SIZE)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    owner = statement_owner()
+    if 'metrics_started' in owner:
+        owner.metrics_sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    owner = statement_owner()
+    if 'metrics_sql_started' in owner:
+        owner.metrics_sql_count += 1
+        owner.metrics_sql_time += time.perf_counter() - owner.pop('metrics_sql_started')
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_time = 0.0
+
+
+def _labels(status):
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return (("method", request.method), ("route", rule), ("status", status))
+
+
+def _count_streamed(response, labels):
+    """
+    Wrap a body the app streams so its size is observed once it has been
+    sent. The body runs after the request context may have gone, so the
+    count lives in this closure and is recorded from call_on_close.
+    """
+    sent = 0
+    chunks = response.response
+
+    def counted():
+        nonlocal sent
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+
+    response.response = counted()
+    response.call_on_close(lambda: RESPONSE_SIZE.observe(labels, sent))
+
+
+def _record_response(response):
+    g.metrics_status = response.status_code
+    if response.is_streamed and inspect.isgenerator(response.response):
+        _count_streamed(response, _labels(response.status_code))
+    else:
+        # Error pages arrive as a WSGI iterable with their Content-Length set
+        g.metrics_size = response.calculate_content_length() or response.content_length
+    return response
+
+
+def _finish_request(exc):
+    # Runs when the request context pops, i.e. after any streamed body is sent
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    labels = _labels(g.get('metrics_status', 500))
+    REQUEST_DURATION.observe(labels, time.perf_counter() - started)
+    SQL_STATEMENTS.observe(labels, g.metrics_sql_count)
+    SQL_DURATION.observe(labels, g.metrics_sql_time)
+    if g.get('metrics_size') is not None:
+        RESPONSE_SIZE.observe(labels, g.metrics_size)
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app, db):
+    """
+    Time every request, count its SQL statements and SQL time through engine
+    events, and expose the histograms on /metrics. Figures are per process.
+    """
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', render_metrics, methods=['GET'])
@@ -1,6 +1,8 @@
 from datetime import datetime
+import json
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import bindparam, case, func, insert, insert_sentinel, select, update
 from . import db
 
 # Term model
@@ -12,6 +14,29 @@ class Term(db.Model):
 
     bus_payments = db.relationship('BusPayment', back_populates='term', lazy=True)
 
+    @staticmethod
+    def current_id():
+        """Id of the latest term that has started, or None."""
+        today = datetime.now().date()
+        return db.session.execute(
+            select(Term.id).where(Term.start_date <= today).order_by(Term.start_date.desc()).limit(1)
+        ).scalar()
+
+    @staticmethod
+    def billing_id():
+        """
+        Id of the term new students are billed for: the latest term that has
+        started or that a rollover has already moved the school into, or None.
+        """
+        today = datetime.now().date()
+        rolled_into = select(RolloverCheckpoint.to_term_id)
+        return db.session.execute(
+            select(Term.id)
+            .where((Term.start_date <= today) | Term.id.in_(rolled_into))
+            .order_by(Term.start_date.desc())
+            .limit(1)
+        ).scalar()
+
     def __repr__(self):
         return f"<Term(name={self.name}, start_date={self.start_date}, end_date={self.end_date})>"
 
@@ -38,13 +63,29 @@ class Staff(db.Model):
 class Grade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(10), nullable=False, unique=True)
+    # Grade-progression map: students move to next_grade at promotion time,
+    # students in a graduating grade leave the school instead
+    next_grade_id = db.Column(db.Integer, db.ForeignKey('grade.id'), nullable=True)
+    graduating = db.Column(db.Boolean, nullable=False, default=False)
+
     term_fees = db.relationship('Fee', back_populates='grade', lazy=True)
+    next_grade = db.relationship('Grade', remote_side=[id])
+
+    @property
+    def pays_boarding_fee(self):
+        """Boarders below grade 5 (including the pre-primary grades) pay the boarding surcharge."""
+        return not self.name.isdigit() or int(self.name) < 5
 
     def __repr__(self):
         return f"<Grade(name={self.name})>"
 
 # Student model
 class Student(db.Model):
+    __table_args__ = (
+        db.Index('ix_student_grade_id', 'grade_id'),
+        db.Index('ix_student_bus_destination_id', 'bus_destination_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     admission_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -58,6 +99,7 @@ class Student(db.Model):
     is_boarding = db.Column(db.Boolean, nullable=False, default=False)
     password = db.Column(db.String(100), nullable=False)
     bus_destination_id = db.Column(db.Integer, db.ForeignKey('bus_destination.id'))
+    is_active = db.Column(db.Boolean, nullable=False, default=True)  # False once graduated
     
     # Relationships
     grade = db.relationship('Grade', backref='students')
@@ -76,23 +118,32 @@ class Student(db.Model):
         """
         Calculate the student's term balance based on their grade, boarding status, and arrears.
         """
+        from app.cache import fee_structure
+        from app.balances import open_term_summaries
+
         # Fetch the term fee for the student's grade
-        fee = Fee.query.filter_by(grade_id=self.grade_id).first()
-        if not fee:
+        term_id = Term.billing_id()
+        fees = fee_structure()
+        amount = fees.opening_fee(self.grade_id, term_id)
+        if amount is None:
             raise ValueError("Fee structure not set for this grade.")
 
         # Default balance
-        self.balance = fee.amount
+        self.balance = amount
         # Students below grade 5 who choose to board pay an additional fee
-        if self.is_boarding and int(self.grade.name) < 5:
-            boarding_fee = BoardingFee.query.first()
-            if boarding_fee:
-                self.balance += boarding_fee.extra_fee
+        if self.is_boarding and db.session.get(Grade, self.grade_id).pays_boarding_fee:
+            self.balance += fees.boarding_surcharge
 
         # Add any arrears to the balance
         if self.arrears:
             self.balance += self.arrears
 
+        # Record what the current term billed in its summary row
+        if term_id is not None:
+            db.session.add(self)
+            db.session.flush()
+            open_term_summaries(db.session, term_id, Student.id == self.id)
+
         db.session.commit()
 
     def update_bus_balance(self, payment_amount):
@@ -101,16 +152,49 @@ class Student(db.Model):
         """
         if not self.use_bus:
             raise ValueError("Student does not use the bus.")
-        
-        self.bus_balance -= payment_amount
-        if self.bus_balance < 0:
-            self.bus_balance = 0
 
+        Student.debit(self.id, payment_amount, bus=True, floor=0)
         db.session.commit()
+
+    @staticmethod
+    def debit(student_id, amount, bus=False, floor=None):
+        """
+        Take amount off a student's fee (or bus) balance with one atomic
+        UPDATE ... RETURNING and return the new balance, or None if there is no
+        such student. Paying the fee balance down to zero clears arrears in the
+        same statement; floor, if given, is the lowest the balance may go.
+        Concurrent debits queue on the row instead of overwriting each other.
+        """
+        column = Student.bus_balance if bus else Student.balance
+        new_balance = func.coalesce(column, 0) - amount
+        if floor is not None:
+            new_balance = case((new_balance < floor, floor), else_=new_balance)
+        values = {column.key: new_balance}
+        if not bus:
+            values['arrears'] = case((new_balance <= 0, 0), else_=Student.arrears)
+
+        stmt = (
+            update(Student)
+            .where(Student.id == student_id)
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(stmt.returning(column)).scalar()
+        # The UPDATE holds the row lock, so reading it back in the same
+        # transaction still sees only this debit
+        if db.session.execute(stmt).rowcount == 0:
+            return None
+        return db.session.execute(select(column).where(Student.id == student_id)).scalar()
         
         
 # Payment model
 class Payment(db.Model):
+    __table_args__ = (
+        db.Index('ix_payment_student_id_date', 'student_id', 'date'),
+        db.Index('ix_payment_term_id_date', 'term_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
@@ -119,8 +203,11 @@ class Payment(db.Model):
     term_id = db.Column(db.String(20), nullable=False)  # Ensure validity
     balance_after_payment = db.Column(db.Float, nullable=False)
     description = db.Column(db.String(255), default="")
+    # Lets a multi-row INSERT ... RETURNING hand back ids in parameter order on
+    # SQLite, which gives no ordering guarantee for autoincrement keys
+    _sentinel = insert_sentinel('sentinel')
 
-    def __init__(self, student_id, amount, method, term_id, balance_after_payment, description=description):
+    def __init__(self, student_id, amount, method, term_id, balance_after_payment, description=None):
         self.student_id = student_id
         self.amount = amount
         self.method = method
@@ -129,40 +216,155 @@ class Payment(db.Model):
         self.description = description or ""
 
     @staticmethod
-    def record_payment(student_id, amount, method, term_id, description=description):
-        from models import Student  # Ensure correct import
-
-        # Fetch the student
-        student = Student.query.get(student_id)
-        if not student:
+    def post(student_id, amount, method, term_id, description=None):
+        """
+        Debit the student and add the payment without committing. An unknown
+        student raises ValueError before anything is written.
+        """
+        # Move the balance (and clear arrears once it is paid off) atomically
+        balance = Student.debit(student_id, amount)
+        if balance is None:
             raise ValueError("Student not found")
 
-        # Update student balance
-        student.balance -= amount
-        if student.balance <= 0:
-            student.arrears = 0  # Ensure 'arrears' exists in Student model
-
         # Create the payment record
         payment = Payment(
             student_id=student_id,
             amount=amount,
             method=method,
-            term_id=term_id,
-            balance_after_payment=student.balance,
+            term_id=str(term_id),
+            balance_after_payment=balance,
             description=description,
         )
         db.session.add(payment)
-        db.session.commit()
+        db.session.flush()
+        return payment
+
+    @staticmethod
+    def record_payment(student_id, amount, method, term_id, description=None):
+        try:
+            payment = Payment.post(student_id, amount, method, term_id, description)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
         return payment
+
+    @staticmethod
+    def _insert_many(rows):
+        """Insert payment rows with one executemany and return their ids in order."""
+        payments = Payment.__table__
+        return db.session.execute(
+            insert(payments).returning(payments.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+    @staticmethod
+    def record_payments(items):
+        """
+        Post a batch of payments in one transaction: one grouped balance
+        UPDATE, one IN query reading the balances it produced and one
+        multi-row insert. Reading after the UPDATE, while its locks are held,
+        keeps balance_after_payment right when other workers post concurrently.
+
+        Returns a result per item, in order, holding either the new payment id
+        or the reason the item was rejected.
+        """
+        from app.balances import apply_deltas
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {"index": index, "error": "Payment must be an object"}
+                continue
+            if not all(item.get(field) for field in ('student_id', 'amount', 'method', 'term_id')):
+                results[index] = {"index": index, "error": "Missing required fields"}
+                continue
+            try:
+                amount = float(item['amount'])
+                student_id = int(item['student_id'])
+                int(item['term_id'])
+            except (TypeError, ValueError):
+                results[index] = {"index": index, "error": "Invalid amount, student_id or term_id"}
+                continue
+            if amount <= 0:
+                results[index] = {"index": index, "error": "Amount must be positive"}
+                continue
+            valid.append((index, student_id, amount, item))
+
+        totals = {}
+        for _, student_id, amount, _ in valid:
+            totals[student_id] = totals.get(student_id, 0) + amount
+
+        try:
+            if totals:
+                # Core executemany: one statement, one parameter set per student
+                students = Student.__table__
+                new_balance = func.coalesce(students.c.balance, 0) - bindparam('total')
+                db.session.execute(
+                    update(students)
+                    .where(students.c.id == bindparam('student'))
+                    .values(
+                        balance=new_balance,
+                        arrears=case((new_balance <= 0, 0), else_=students.c.arrears),
+                    ),
+                    [{"student": student_id, "total": total} for student_id, total in totals.items()],
+                )
+
+            # Unknown students matched no row above; the rest start from their
+            # balance before this batch and step down payment by payment
+            balances = {
+                student_id: (balance or 0) + totals[student_id]
+                for student_id, balance in db.session.execute(
+                    select(Student.id, Student.balance).where(Student.id.in_(list(totals)))
+                )
+            } if totals else {}
+
+            payments = []
+            paid = {}
+            for index, student_id, amount, item in valid:
+                if student_id not in balances:
+                    results[index] = {"index": index, "error": "Student not found"}
+                    continue
+                balances[student_id] -= amount
+                term_totals = paid.setdefault((student_id, int(item['term_id'])), {'paid': 0, 'payment_count': 0})
+                term_totals['paid'] += amount
+                term_totals['payment_count'] += 1
+                payments.append((index, {
+                    "student_id": student_id,
+                    "amount": amount,
+                    "method": item['method'],
+                    "term_id": str(item['term_id']),
+                    "balance_after_payment": balances[student_id],
+                    "description": item.get('description') or "",
+                }))
+
+            if payments:
+                payment_ids = Payment._insert_many([row for _, row in payments])
+                for (index, _), payment_id in zip(payments, payment_ids):
+                    results[index] = {"index": index, "payment_id": payment_id}
+                # Core inserts skip the flush hook, so post the summary totals here
+                apply_deltas(db.session.connection(), paid)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return results
         
 # Fee model for each term and grade
 class Fee(db.Model):
+    __table_args__ = (
+        db.Index('ix_fee_grade_id_term_id', 'grade_id', 'term_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False)
     grade_id = db.Column(db.Integer, db.ForeignKey('grade.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
 
+    grade = db.relationship('Grade', back_populates='term_fees')
+
     def __repr__(self):
         return f"<Fee(term_id={self.term_id}, grade_id={self.grade_id}, amount={self.amount})>"
 
@@ -222,12 +424,18 @@ class BusDestination(db.Model):
     name = db.Column(db.String(100), nullable=False)
     charge = db.Column(db.Float, nullable=False)
 
-students = db.relationship("Student", back_populates="bus_destination", lazy="dynamic")
-def __repr__(self):
+    students = db.relationship("Student", back_populates="bus_destination", lazy="dynamic")
+
+    def __repr__(self):
         return f"<BusDestination(name={self.name}, charge={self.charge})>"
 
 # Bus Payment model
 class BusPayment(db.Model):
+    __table_args__ = (
+        db.Index('ix_bus_payment_student_id_term_id', 'student_id', 'term_id'),
+        db.Index('ix_bus_payment_term_id_payment_date', 'term_id', 'payment_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False)
@@ -245,10 +453,25 @@ class BusPayment(db.Model):
         self.term_id = term_id
         self.amount = amount
         self.destination_id = destination_id
-        student = Student.query.get(student_id)
-        if student:
-            student.bus_balance -= amount
-            db.session.commit()
+
+    @staticmethod
+    def post(student_id, term_id, amount, destination_id=None):
+        """
+        Debit the bus balance and add the payment without committing. An
+        unknown student raises ValueError before anything is written.
+        """
+        if Student.debit(student_id, amount, bus=True) is None:
+            raise ValueError("Student not found")
+
+        bus_payment = BusPayment(
+            student_id=student_id,
+            term_id=term_id,
+            amount=amount,
+            destination_id=destination_id,
+        )
+        db.session.add(bus_payment)
+        db.session.flush()
+        return bus_payment
 
     def __repr__(self):
         return f"<BusPayment(student_id={self.student_id}, term_id={self.term_id}, destination_id={self.destination_id}, amount={self.amount}, payment_date={self.payment_date})>"
@@ -261,3 +484,194 @@ class Notification(db.Model):
 
     def __repr__(self):
         return f'<Notification {self.id} - {self.message}>'
+
+# Running per-student, per-term totals, kept in step with every payment write
+# (see app/balances.py) so balance reads and term reports never rescan payments
+class StudentTermBalance(db.Model):
+    __tablename__ = 'student_term_balance'
+    __table_args__ = (
+        db.Index('ix_student_term_balance_term_id', 'term_id'),
+    )
+
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id'), primary_key=True)
+    arrears_brought_forward = db.Column(db.Float, nullable=False, default=0.0)
+    billed = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    bus_billed = db.Column(db.Float, nullable=False, default=0.0)
+    bus_paid = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def balance(self):
+        return self.arrears_brought_forward + self.billed - self.paid
+
+    @property
+    def bus_balance(self):
+        return self.bus_billed - self.bus_paid
+
+    def to_dict(self):
+        return {
+            "student_id": self.student_id,
+            "term_id": self.term_id,
+            "arrears_brought_forward": self.arrears_brought_forward,
+            "billed": self.billed,
+            "paid": self.paid,
+            "payment_count": self.payment_count,
+            "balance": self.balance,
+            "bus_billed": self.bus_billed,
+            "bus_paid": self.bus_paid,
+            "bus_balance": self.bus_balance,
+        }
+
+    def __repr__(self):
+        return f'<StudentTermBalance student={self.student_id} term={self.term_id} balance={self.balance}>'
+
+# Itemised term charges written by a billing run (see app/billing.py)
+class Charge(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'term_id', 'kind', name='uq_charge_student_id_term_id_kind'),
+        db.Index('ix_charge_billing_run_id', 'billing_run_id'),
+        db.Index('ix_charge_term_id', 'term_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # tuition, boarding or bus
+    amount = db.Column(db.Float, nullable=False)
+    billing_run_id = db.Column(db.Integer, db.ForeignKey('billing_run.id'), nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "student_id": self.student_id,
+            "term_id": self.term_id,
+            "kind": self.kind,
+            "amount": self.amount,
+            "billing_run_id": self.billing_run_id,
+        }
+
+    def __repr__(self):
+        return f'<Charge {self.kind} {self.amount} student={self.student_id} term={self.term_id}>'
+
+# One row per billing run, holding the totals of the charges it wrote
+class BillingRun(db.Model):
+    __tablename__ = 'billing_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False)
+    students_billed = db.Column(db.Integer, nullable=False, default=0)
+    charge_count = db.Column(db.Integer, nullable=False, default=0)
+    tuition_total = db.Column(db.Float, nullable=False, default=0.0)
+    boarding_total = db.Column(db.Float, nullable=False, default=0.0)
+    bus_total = db.Column(db.Float, nullable=False, default=0.0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    # Net change applied to student balances after what the term had already billed
+    balance_adjustment = db.Column(db.Float, nullable=False, default=0.0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "term_id": self.term_id,
+            "students_billed": self.students_billed,
+            "charge_count": self.charge_count,
+            "tuition_total": self.tuition_total,
+            "boarding_total": self.boarding_total,
+            "bus_total": self.bus_total,
+            "total": self.total,
+            "balance_adjustment": self.balance_adjustment,
+            "created_at": self.created_at,
+        }
+
+    def __repr__(self):
+        return f'<BillingRun {self.id} term={self.term_id} total={self.total}>'
+
+# Background job queue for long-running school-wide work (see app/jobqueue.py)
+class Job(db.Model):
+    __table_args__ = (
+        # At most one job may be running at any time
+        db.Index('ix_job_one_running', 'status', unique=True,
+                 sqlite_where=db.text("status = 'running'"),
+                 postgresql_where=db.text("status = 'running'")),
+        # At most one job of each kind may be queued or running
+        db.Index('ix_job_one_active_kind', 'kind', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text, nullable=False, default='{}')
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    total_rows = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Which worker claimed the job and when it last proved it is still alive
+    worker_id = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        progress = None
+        if self.total_rows:
+            progress = round(min(self.rows_processed / self.total_rows, 1.0), 4)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "progress": progress,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "worker_id": self.worker_id,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+# One row per term rolled into, advanced in the same transaction as each
+# rollover chunk so an interrupted run resumes after the last committed student
+class RolloverCheckpoint(db.Model):
+    to_term_id = db.Column(db.Integer, db.ForeignKey('term.id'), primary_key=True)
+    from_term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False)
+    last_student_id = db.Column(db.Integer, nullable=False, default=0)
+    # Students created after the run started are billed for the new term when
+    # they are added (Term.billing_id), so the run stops at the highest id it saw
+    max_student_id = db.Column(db.Integer, nullable=False, default=0)
+    total_students = db.Column(db.Integer, nullable=False, default=0)
+    students_rolled_over = db.Column(db.Integer, nullable=False, default=0)
+    bus_balances_rolled_over = db.Column(db.Integer, nullable=False, default=0)
+    prepayments_cleared = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def summary(self):
+        return {
+            "from_term": self.from_term_id,
+            "to_term": self.to_term_id,
+            "students_rolled_over": self.students_rolled_over,
+            "bus_balances_rolled_over": self.bus_balances_rolled_over,
+            "prepayments_cleared": self.prepayments_cleared,
+        }
+
+    def __repr__(self):
+        return f'<RolloverCheckpoint term {self.to_term_id} at student {self.last_student_id}>'
+
+# Per-table change counters shared by every worker; bumped in the same
+# transaction as a write so in-process caches know when to reload
+class ChangeCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.version}>'
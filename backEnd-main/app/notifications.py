@@ -0,0 +1,101 @@
+from app.models import db, Notification
+from sqlalchemy import select, func
+import json
+import threading
+import time
+
+
+class NotificationBroadcaster:
+    """
+    Wakes this process's event streams as soon as add_notification commits.
+    Streams in other workers catch up on their next poll.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.latest_id = 0
+
+    def publish(self, notification_id):
+        with self.condition:
+            self.latest_id = max(self.latest_id, notification_id)
+            self.condition.notify_all()
+
+    def wait(self, last_id, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest_id > last_id, timeout=timeout)
+
+
+broadcaster = NotificationBroadcaster()
+
+
+class StreamSlots:
+    """
+    Caps this process's open event streams. Each one holds a worker thread for
+    the whole stream, so without a cap a few dashboards starve every request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+
+    def acquire(self, limit):
+        with self.lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def notifications_after(since, limit):
+    return db.session.execute(
+        select(Notification).where(Notification.id > since).order_by(Notification.id).limit(limit)
+    ).scalars().all()
+
+
+def latest_notification_id():
+    return db.session.execute(select(func.coalesce(func.max(Notification.id), 0))).scalar()
+
+
+def latest_notifications(limit):
+    newest = db.session.execute(
+        select(Notification).order_by(Notification.id.desc()).limit(limit)
+    ).scalars().all()
+    return list(reversed(newest))
+
+
+def to_dict(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'date': notification.date
+    }
+
+
+def event_stream(since, duration, poll_interval, batch_size):
+    """
+    Server-sent events for every notification after `since`. The stream ends
+    after `duration` seconds; EventSource reconnects with Last-Event-ID, which
+    the opening id line sets even if no notification arrives meanwhile.
+    """
+    deadline = time.monotonic() + duration
+    yield f'retry: 3000\nid: {since}\n\n'
+    while time.monotonic() < deadline:
+        # Copy the rows out before ending the read transaction, which expires
+        # them, so a long-lived stream never pins a snapshot or reloads rows
+        notifications = [to_dict(notification) for notification in notifications_after(since, batch_size)]
+        db.session.rollback()
+        for item in notifications:
+            since = item['id']
+            item['date'] = item['date'].isoformat() if item['date'] else None
+            yield f'id: {since}\nevent: notification\ndata: {json.dumps(item)}\n\n'
+        if len(notifications) == batch_size:
+            continue
+        yield ': keep-alive\n\n'
+        broadcaster.wait(since, min(poll_interval, max(deadline - time.monotonic(), 0)))
@@ -0,0 +1,124 @@
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from collections import Counter, deque
+from contextlib import contextmanager
+import logging
+import os
+import re
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Most recent budget or repetition reports, newest last, for test harnesses
+recent_reports = deque(maxlen=100)
+
+_whitespace = re.compile(r'\s+')
+_placeholder_list = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_attributed = threading.local()
+
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may run per request."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+@contextmanager
+def statements_for(owner):
+    """
+    Charge the SQL run inside the block to owner, another request's flask.g,
+    instead of the request running it. Used when one thread writes on behalf
+    of several requests.
+    """
+    previous = getattr(_attributed, 'owner', None)
+    _attributed.owner = owner
+    try:
+        yield
+    finally:
+        _attributed.owner = previous
+
+
+def statement_owner():
+    """The flask.g that SQL run right now is charged to."""
+    owner = getattr(_attributed, 'owner', None)
+    return g if owner is None else owner
+
+
+def fingerprint(statement):
+    """Reduce a statement to its shape so calls differing only in parameters match."""
+    statement = _literal.sub('?', statement)
+    statement = _placeholder_list.sub('(?...)', statement)
+    return _whitespace.sub(' ', statement).strip()
+
+
+def _call_site():
+    """The innermost application frame that issued the statement."""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(APP_DIR) and not frame.filename.endswith('querywatch.py'):
+            return f"{os.path.relpath(frame.filename, os.path.dirname(APP_DIR))}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    owner = statement_owner()
+    if 'querywatch' in owner:
+        owner.querywatch.append((fingerprint(statement), _call_site()))
+
+
+def _start_request():
+    g.querywatch = []
+
+
+def _finish_request(exc):
+    statements = g.pop('querywatch', None)
+    if statements is None:
+        return
+
+    threshold = current_app.config['QUERY_REPEAT_THRESHOLD']
+    counts = Counter(shape for shape, _ in statements)
+    repeated = []
+    for shape, count in counts.items():
+        if count >= threshold:
+            sites = Counter(site for statement_shape, site in statements if statement_shape == shape)
+            repeated.append({"statement": shape, "count": count, "call_sites": dict(sites)})
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    over_budget = budget is not None and len(statements) > budget
+    if not repeated and not over_budget:
+        return
+
+    report = {
+        "route": request.url_rule.rule if request.url_rule else request.path,
+        "method": request.method,
+        "statements": len(statements),
+        "budget": budget,
+        "repeated": repeated,
+    }
+    recent_reports.append(report)
+    if over_budget:
+        logger.warning("%s %s ran %d SQL statements, over its budget of %d",
+                       report["method"], report["route"], len(statements), budget)
+    for item in repeated:
+        logger.warning("%s %s repeated a statement %d times (possible N+1) from %s: %s",
+                       report["method"], report["route"], item["count"],
+                       ", ".join(item["call_sites"]), item["statement"])
+
+
+def init_app(app, db):
+    """
+    Development/test mode: fingerprint each request's SQL, warn about repeated
+    statement shapes with their call sites and check declared query budgets.
+    """
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
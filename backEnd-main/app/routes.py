@@ -1,10 +1,23 @@
-from flask import request, jsonify, Blueprint
-from .models import db, Staff,  Student, Payment, Fee, BusPayment, BusDestination, Term, Gallery, Notification, Grade
+from flask import request, jsonify, Blueprint, Response, stream_with_context, g
+from .models import db, Staff,  Student, Payment, Fee, BusPayment, BusDestination, Term, Gallery, Notification, Grade, StudentTermBalance, Job, BillingRun
 from flask import current_app as app
+import csv
+import io
+import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import select, literal, func, and_
 from sqlalchemy.exc import IntegrityError
-from app.jobs import process_term_rollover, promote_students
+from app.jobs import promote_students, set_grade_progression
+from app.jobqueue import enqueue
+from app.imports import import_students
+from app.cache import fee_structure, bump_version, versioned_response, FEES, TERMS, GRADES, NOTIFICATIONS, BILLING, BUS
+from app.dashboard import finance_dashboard
+from app.search import search_students
+from app.billing import charge_totals
+from app.groupcommit import commit_write
+from app.querywatch import query_budget
+from app.notifications import broadcaster, stream_slots, event_stream, notifications_after, latest_notifications, latest_notification_id, to_dict as notification_to_dict
 
 logging.basicConfig(level=logging.DEBUG)
 routes = Blueprint('routes', __name__)
@@ -14,7 +27,7 @@ def login():
     try:
         data = request.get_json()
         identifier = data.get('identifier')  # admission_number or name
-        password = gvdata.get('password')
+        password = data.get('password')
 
         if not identifier or not password:
             return jsonify({"error": "Missing identifier or password"}), 400
@@ -63,7 +76,6 @@ def add_student():
             use_bus=data['use_bus'],
             arrears=data.get('arrears', 0.0),
             bus_balance=data.get('bus_balance', 0.0),
-            created_at=datetime.utcnow()
         )
         # Set password to admission number
         student.set_password(data['admission_number'])
@@ -73,6 +85,7 @@ def add_student():
 
         # Commit to database
         db.session.add(student)
+        bump_version(BILLING)
         db.session.commit()
         return jsonify({"message": "Student added successfully"}), 201
     except IntegrityError:
@@ -82,10 +95,126 @@ def add_student():
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
+# Bulk-register students from a JSON list or a CSV upload
+@routes.route('/students/bulk', methods=['POST'])
+def add_students_bulk():
+    if 'file' in request.files:
+        rows = list(csv.DictReader(io.StringIO(request.files['file'].read().decode('utf-8-sig'))))
+    elif request.mimetype == 'text/csv':
+        rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get('students') if isinstance(data, dict) else data
+
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "A non-empty list of students is required"}), 400
+
+    term_id = request.args.get('term_id', type=int)
+    created, errors = import_students(rows, term_id=term_id)
+    status = 201 if created else 400
+    return jsonify({"message": f"{created} students added", "created": created, "errors": errors}), status
+
+# Columns GET /students may project; password is deliberately left out
+STUDENT_FIELDS = {
+    'id': Student.id,
+    'name': Student.name,
+    'admission_number': Student.admission_number,
+    'grade_id': Student.grade_id,
+    'phone': Student.phone,
+    'balance': Student.balance,
+    'arrears': Student.arrears,
+    'term_fee': Student.term_fee,
+    'use_bus': Student.use_bus,
+    'bus_balance': Student.bus_balance,
+    'is_boarding': Student.is_boarding,
+    'bus_destination_id': Student.bus_destination_id,
+    'is_active': Student.is_active,
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 1000
+MAX_NOTIFICATIONS_PAGE = 200
+SEARCH_FIELDS = 'id,name,admission_number,phone,grade_id,is_active'
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+
+
+def _parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean value '{value}'")
+
+
 @routes.route('/students', methods=['GET'])
+@query_budget(2)
 def get_students():
-    students = Student.query.all()
-    return jsonify([student.name for student in students])
+    """
+    List students one keyset page at a time.
+
+    Query parameters: cursor (last id of the previous page), limit, fields
+    (comma-separated columns to return) and the filters grade_id, use_bus,
+    is_boarding, min_balance and max_balance.
+    """
+    args = request.args
+    try:
+        fields = args.get('fields', 'id,name').split(',')
+        unknown = [field for field in fields if field not in STUDENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        limit = min(args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+
+        # id always rides along so the next cursor can be computed
+        columns = [Student.id] + [STUDENT_FIELDS[field] for field in fields if field != 'id']
+        query = select(*columns).order_by(Student.id).limit(limit + 1)
+
+        if 'cursor' in args:
+            query = query.where(Student.id > int(args['cursor']))
+        if 'grade_id' in args:
+            query = query.where(Student.grade_id == int(args['grade_id']))
+        if 'use_bus' in args:
+            query = query.where(Student.use_bus.is_(_parse_bool(args['use_bus'])))
+        if 'is_boarding' in args:
+            query = query.where(Student.is_boarding.is_(_parse_bool(args['is_boarding'])))
+        if 'min_balance' in args:
+            query = query.where(Student.balance >= float(args['min_balance']))
+        if 'max_balance' in args:
+            query = query.where(Student.balance <= float(args['max_balance']))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = db.session.execute(query).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    students = [{field: getattr(row, field) for field in fields} for row in rows[:limit]]
+    return jsonify({"students": students, "next_cursor": next_cursor})
+
+# Ranked lookup by partial name, admission number or phone
+@routes.route('/students/search', methods=['GET'])
+@query_budget(1)
+def search_students_route():
+    args = request.args
+    q = args.get('q', '').strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        fields = args.get('fields', SEARCH_FIELDS).split(',')
+        unknown = [field for field in fields if field not in STUDENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        limit = min(args.get('limit', DEFAULT_SEARCH_RESULTS, type=int), MAX_SEARCH_RESULTS)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        rows = search_students(q, [STUDENT_FIELDS[field] for field in fields], limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"students": [{field: getattr(row, field) for field in fields} for row in rows]})
 
 @routes.route('/students/<int:id>', methods=['GET'])
 # Update Student
@@ -113,6 +242,7 @@ def update_student(student_id):
         student.initialize_balance()
 
     # Commit changes
+    bump_version(BILLING)
     db.session.commit()
     return jsonify({"message": "Student updated successfully"}), 200
 
@@ -125,6 +255,7 @@ def delete_student(student_id):
         return jsonify({"error": "Student not found"}), 404
 
     db.session.delete(student)
+    bump_version(BILLING)
     db.session.commit()
     return jsonify({"message": "Student deleted successfully"}), 200
 
@@ -132,24 +263,28 @@ def delete_student(student_id):
 # Update Balance After Payment
 @routes.route('/students/<int:student_id>/update-balance', methods=['POST'])
 def update_balance(student_id):
-    student = Student.query.get(student_id)
-    if not student:
-        return jsonify({"error": "Student not found"}), 404
-
     data = request.get_json()
     payment_amount = data.get('payment_amount')
     if not payment_amount or payment_amount <= 0:
         return jsonify({"error": "Valid payment amount is required"}), 400
+    term_id = data.get('term_id') or Term.current_id()
+    if term_id is None:
+        return jsonify({"error": "No current term; pass term_id"}), 400
+    try:
+        term_id = _payment_term_id(term_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Update student balance; it never drops below zero on this route
+    balance = Student.debit(student_id, payment_amount, floor=0)
+    if balance is None:
+        db.session.rollback()
+        return jsonify({"error": "Student not found"}), 404
 
     # Record the payment
-    payment = Payment(student_id=student.id, amount=payment_amount, date=datetime.utcnow())
+    payment = Payment(student_id=student_id, amount=payment_amount, method=data.get('method', 'cash'),
+                      term_id=str(term_id), balance_after_payment=balance)
     db.session.add(payment)
-
-    # Update student balance
-    student.balance -= payment_amount
-    if student.balance < 0:
-        student.balance = 0
-
     db.session.commit()
     return jsonify({"message": "Student balance updated successfully"}), 200
     
@@ -206,6 +341,7 @@ def get_student(id):
 
 # Add Payment
 @routes.route('/payments', methods=['POST'])
+@query_budget(6)
 def add_payment():
     data = request.get_json()
     try:
@@ -217,15 +353,21 @@ def add_payment():
 
         if not all([student_id, amount, method, term_id]):
             return jsonify({"error": "Missing required fields"}), 400
-
-        payment = Payment.record_payment(
-            student_id=student_id,
-            amount=amount,
-            method=method,
-            term_id=term_id,
-            description=description,
+        try:
+            term_id = _payment_term_id(term_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        payment_id = commit_write(
+            lambda: Payment.post(
+                student_id=student_id,
+                amount=amount,
+                method=method,
+                term_id=term_id,
+                description=description,
+            ).id
         )
-        return jsonify({"message": "Payment added successfully", "payment_id": payment.id}), 201
+        return jsonify({"message": "Payment added successfully", "payment_id": payment_id}), 201
 
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
@@ -233,6 +375,25 @@ def add_payment():
         return jsonify({"error": "An error occurred while adding payment", "details": str(e)}), 500
 
 
+# Post many payments at once, e.g. from a bank or mobile-money statement
+@routes.route('/payments/batch', methods=['POST'])
+@query_budget(6)
+def add_payments_batch():
+    data = request.get_json(silent=True)
+    items = data.get('payments') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty list of payments is required"}), 400
+
+    try:
+        results = Payment.record_payments(items)
+    except Exception as e:
+        return jsonify({"error": "An error occurred while adding payments", "details": str(e)}), 500
+
+    created = sum(1 for result in results if 'payment_id' in result)
+    status = 201 if created else 400
+    return jsonify({"message": f"{created} payments added", "created": created, "results": results}), status
+
+
 # Edit Payment
 @routes.route('/payments/<int:payment_id>', methods=['PUT'])
 def edit_payment(payment_id):
@@ -241,12 +402,18 @@ def edit_payment(payment_id):
         payment = Payment.query.get(payment_id)
         if not payment:
             return jsonify({"error": "Payment not found"}), 404
+        if 'term_id' in data:
+            try:
+                data['term_id'] = str(_payment_term_id(data['term_id']))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
         payment.amount = data.get('amount', payment.amount)
         payment.method = data.get('method', payment.method)
         payment.term_id = data.get('term_id', payment.term_id)
         payment.description = data.get('description', payment.description)
 
+        bump_version(BILLING)
         db.session.commit()
         return jsonify({"message": "Payment updated successfully"}), 200
 
@@ -263,6 +430,7 @@ def delete_payment(payment_id):
             return jsonify({"error": "Payment not found"}), 404
 
         db.session.delete(payment)
+        bump_version(BILLING)
         db.session.commit()
         return jsonify({"message": "Payment deleted successfully"}), 200
 
@@ -312,6 +480,175 @@ def get_payment(payment_id):
     except Exception as e:
         return jsonify({"error": "An error occurred while fetching payment", "details": str(e)}), 500
 
+# Balance for one student and term, read straight from the summary table
+@routes.route('/students/<int:student_id>/balances/<int:term_id>', methods=['GET'])
+@query_budget(3)
+def get_student_term_balance(student_id, term_id):
+    summary = db.session.get(StudentTermBalance, (student_id, term_id))
+    if not summary:
+        student = db.session.get(Student, student_id)
+        if not student:
+            return jsonify({"error": "Student not found"}), 404
+        # Nothing recorded for the term: the current term still carries the
+        # student's balance, any other term billed them nothing
+        arrears = billed = bus_billed = 0.0
+        if term_id == Term.current_id():
+            arrears = student.arrears or 0.0
+            billed = (student.balance or 0.0) - arrears
+            bus_billed = student.bus_balance or 0.0
+        summary = StudentTermBalance(student_id=student_id, term_id=term_id, arrears_brought_forward=arrears,
+                                     billed=billed, paid=0.0, payment_count=0, bus_billed=bus_billed, bus_paid=0.0)
+    return jsonify(summary.to_dict()), 200
+
+
+# Term totals aggregated over the summary table
+@routes.route('/reports/terms/<int:term_id>', methods=['GET'])
+@query_budget(1)
+def get_term_report(term_id):
+    totals = db.session.execute(
+        select(
+            func.count(StudentTermBalance.student_id).label('students'),
+            func.coalesce(func.sum(StudentTermBalance.arrears_brought_forward), 0).label('arrears_brought_forward'),
+            func.coalesce(func.sum(StudentTermBalance.billed), 0).label('billed'),
+            func.coalesce(func.sum(StudentTermBalance.paid), 0).label('paid'),
+            func.coalesce(func.sum(StudentTermBalance.payment_count), 0).label('payment_count'),
+            func.coalesce(func.sum(StudentTermBalance.bus_billed), 0).label('bus_billed'),
+            func.coalesce(func.sum(StudentTermBalance.bus_paid), 0).label('bus_paid'),
+        ).where(StudentTermBalance.term_id == term_id)
+    ).one()
+    report = dict(totals._mapping)
+    report['term_id'] = term_id
+    report['outstanding'] = report['arrears_brought_forward'] + report['billed'] - report['paid']
+    report['bus_outstanding'] = report['bus_billed'] - report['bus_paid']
+    return jsonify(report), 200
+
+
+def _requested_term_id():
+    """The term_id query argument, defaulting to the current term; resolved once per request."""
+    if 'requested_term_id' not in g:
+        term_id = request.args.get('term_id', type=int)
+        g.requested_term_id = term_id if term_id is not None else Term.current_id()
+    return g.requested_term_id
+
+
+def _payment_term_id(value):
+    """Payment.term_id is text, but the term summary keys it as an integer term id."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid term_id '{value}'") from None
+
+
+# Finance totals for a term, grouped by grade, boarding and bus destination
+@routes.route('/dashboard/finance', methods=['GET'])
+@query_budget(11)
+def get_finance_dashboard():
+    term_id = _requested_term_id()
+    if term_id is None:
+        return jsonify({"error": "No current term; pass term_id"}), 400
+    return jsonify(finance_dashboard(term_id)), 200
+
+
+EXPORT_COLUMNS = ['kind', 'id', 'student_id', 'admission_number', 'amount', 'date', 'method',
+                  'term_id', 'description']
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+@routes.route('/exports/payments', methods=['GET'])
+@query_budget(2)
+def export_payments():
+    """
+    Stream the payments ledger (fee payments followed by bus payments) as CSV or
+    NDJSON. Rows come off a server-side cursor in batches so memory stays flat.
+
+    Query parameters: format (csv or ndjson), term_id, from and to (YYYY-MM-DD,
+    inclusive) and method. Bus payments carry no method, so filtering on method
+    limits the export to fee payments.
+    """
+    args = request.args
+    export_format = args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    try:
+        date_from = _parse_date(args['from']) if 'from' in args else None
+        date_to = _parse_date(args['to']) + timedelta(days=1) if 'to' in args else None
+        term_id = int(args['term_id']) if 'term_id' in args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    method = args.get('method')
+
+    fee_query = (
+        select(
+            literal('fee').label('kind'), Payment.id, Payment.student_id, Student.admission_number,
+            Payment.amount, Payment.date, Payment.method, Payment.term_id, Payment.description,
+        )
+        .join(Student, Payment.student_id == Student.id)
+        .order_by(Payment.id)
+    )
+    if term_id is not None:
+        fee_query = fee_query.where(Payment.term_id == str(term_id))
+    if date_from:
+        fee_query = fee_query.where(Payment.date >= date_from)
+    if date_to:
+        fee_query = fee_query.where(Payment.date < date_to)
+    if method:
+        fee_query = fee_query.where(Payment.method == method)
+
+    queries = [fee_query]
+    if not method:
+        bus_query = (
+            select(
+                literal('bus').label('kind'), BusPayment.id, BusPayment.student_id, Student.admission_number,
+                BusPayment.amount, BusPayment.payment_date.label('date'), literal(None).label('method'),
+                BusPayment.term_id, literal(None).label('description'),
+            )
+            .join(Student, BusPayment.student_id == Student.id)
+            .order_by(BusPayment.id)
+        )
+        if term_id is not None:
+            bus_query = bus_query.where(BusPayment.term_id == term_id)
+        if date_from:
+            bus_query = bus_query.where(BusPayment.payment_date >= date_from)
+        if date_to:
+            bus_query = bus_query.where(BusPayment.payment_date < date_to)
+        queries.append(bus_query)
+
+    def rows():
+        for query in queries:
+            for row in db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+                yield row
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows():
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        for row in rows():
+            item = dict(row._mapping)
+            item['date'] = item['date'].isoformat() if item['date'] else None
+            yield json.dumps(item) + '\n'
+
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=payments.{export_format}'},
+    )
+
 @routes.route('/students/<int:student_id>/payments/term/<int:term_id>', methods=['GET'])
 def get_student_payments_by_term(student_id, term_id):
     payments = Payment.query.filter_by(student_id=student_id).join(Fee).filter(Fee.term_id == term_id).all()
@@ -326,17 +663,22 @@ def get_student_payments_by_term(student_id, term_id):
     ])
 
 @routes.route('/get_student_bus_destinations/<int:student_id>', methods=['GET'])
+@query_budget(1)
 def get_student_bus_destinations(student_id):
-    student = Student.query.get(student_id)
-    if not student:
+    row = db.session.execute(
+        select(Student.id, BusDestination.name, BusDestination.charge)
+        .outerjoin(BusDestination, Student.bus_destination_id == BusDestination.id)
+        .where(Student.id == student_id)
+    ).first()
+    if not row:
         return jsonify({"error": "Student not found"}), 404
 
-    bus_destinations = student.bus_destinations  # Use the relationship to get bus destinations
+    # A student rides to at most one destination
     result = [{
-        'bus_destination': destination.name,
-        'charge': destination.charge
-    } for destination in bus_destinations]
-    
+        'bus_destination': row.name,
+        'charge': row.charge
+    }] if row.name is not None else []
+
     return jsonify(result), 200
 
 @routes.route('/create-term', methods=['POST'])
@@ -348,6 +690,7 @@ def create_term():
 
     term = Term(name=name, start_date=start_date, end_date=end_date)
     db.session.add(term)
+    bump_version(TERMS)
     db.session.commit()
     
     return jsonify({"message": "Term created successfully", "term": {
@@ -358,6 +701,8 @@ def create_term():
     }})
 
 @routes.route('/terms', methods=['GET'])
+@query_budget(2)
+@versioned_response(TERMS)
 def get_terms():
     terms = Term.query.all()
     return jsonify([{
@@ -375,24 +720,22 @@ def create_bus_payment():
     term_id = data['term_id']
     destination_id = data.get('destination_id', None)
 
-    bus_payment = BusPayment(
-        student_id=student_id,
-        term_id=term_id,
-        amount=amount,
-        destination_id=destination_id
-    )
-    db.session.add(bus_payment)
-    db.session.commit()
+    def write():
+        bus_payment = BusPayment.post(student_id, term_id, amount, destination_id)
+        bump_version(BUS)
+        return bus_payment.payment_date
 
-    # Update the student's bus balance
-    bus_payment.update_student_bus_balance()
+    try:
+        payment_date = commit_write(write)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
 
     return jsonify({
         'message': 'Bus payment created successfully',
         'bus_payment': {
             'student_id': student_id,
             'amount': amount,
-            'payment_date': bus_payment.payment_date
+            'payment_date': payment_date
         }
     })
 
@@ -416,6 +759,8 @@ def assign_student_to_bus():
 
     # Assign the bus destination to the student
     student.bus_destination_id = destination.id
+    bump_version(BILLING)
+    bump_version(BUS)
     db.session.commit()
 
     return jsonify({
@@ -425,28 +770,114 @@ def assign_student_to_bus():
     })
 
 @routes.route('/students-with-destinations', methods=['GET'])
+@query_budget(1)
 def get_students_with_destinations():
-    # Query all students
-    students = Student.query.all()
-
-    # Prepare a list of students with their destinations
-    result = []
-    for student in students:
-        result.append({
-            "student_id": student.id,
-            "name": student.name,
-            "admission_number": student.admission_number,
-            "grade": student.grade.name if student.grade else None,
-            "destination": {
-                "id": student.bus_destination.id if student.bus_destination else None,
-                "name": student.bus_destination.name if student.bus_destination else "No destination assigned",
-                "charge": student.bus_destination.charge if student.bus_destination else None
+    # One joined query for every student, streamed out as the rows arrive
+    query = (
+        select(
+            Student.id,
+            Student.name,
+            Student.admission_number,
+            Grade.name.label('grade'),
+            BusDestination.id.label('destination_id'),
+            BusDestination.name.label('destination_name'),
+            BusDestination.charge.label('destination_charge'),
+        )
+        .outerjoin(Grade, Student.grade_id == Grade.id)
+        .outerjoin(BusDestination, Student.bus_destination_id == BusDestination.id)
+        .order_by(Student.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+
+    def generate():
+        yield '['
+        for index, row in enumerate(db.session.execute(query)):
+            item = {
+                "student_id": row.id,
+                "name": row.name,
+                "admission_number": row.admission_number,
+                "grade": row.grade,
+                "destination": {
+                    "id": row.destination_id,
+                    "name": row.destination_name or "No destination assigned",
+                    "charge": row.destination_charge
+                }
             }
+            yield (',' if index else '') + json.dumps(item)
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+# Every route's riders with their bus balances and what they have paid this term
+@routes.route('/bus/manifests', methods=['GET'])
+@query_budget(4)
+@versioned_response(BUS, BILLING, vary=_requested_term_id)
+def get_bus_manifests():
+    term_id = _requested_term_id()
+    if term_id is None:
+        return jsonify({"error": "No current term; pass term_id"}), 400
+
+    paid_this_term = func.coalesce(func.sum(BusPayment.amount), 0)
+    rows = db.session.execute(
+        select(
+            BusDestination.id.label('destination_id'),
+            BusDestination.name.label('destination_name'),
+            BusDestination.charge,
+            Student.id.label('student_id'),
+            Student.name,
+            Student.admission_number,
+            Student.phone,
+            Grade.name.label('grade'),
+            Student.bus_balance,
+            paid_this_term.label('paid_this_term'),
+        )
+        .select_from(BusDestination)
+        .outerjoin(Student, and_(Student.bus_destination_id == BusDestination.id,
+                                 Student.use_bus.is_(True), Student.is_active.is_(True)))
+        .outerjoin(Grade, Student.grade_id == Grade.id)
+        .outerjoin(BusPayment, and_(BusPayment.student_id == Student.id, BusPayment.term_id == term_id))
+        .group_by(BusDestination.id, Student.id, Grade.id)
+        .order_by(BusDestination.name, BusDestination.id, Student.name)
+    ).all()
+
+    manifests = {}
+    for row in rows:
+        manifest = manifests.get(row.destination_id)
+        if manifest is None:
+            manifest = manifests[row.destination_id] = {
+                "id": row.destination_id,
+                "name": row.destination_name,
+                "charge": row.charge,
+                "riders": [],
+                "rider_count": 0,
+                "paid_count": 0,
+                "unpaid_count": 0,
+                "collected": 0,
+                "outstanding": 0,
+            }
+        if row.student_id is None:
+            continue
+        balance = row.bus_balance or 0
+        paid = balance <= 0
+        manifest["riders"].append({
+            "student_id": row.student_id,
+            "name": row.name,
+            "admission_number": row.admission_number,
+            "phone": row.phone,
+            "grade": row.grade,
+            "bus_balance": balance,
+            "paid_this_term": row.paid_this_term,
+            "paid": paid,
         })
+        manifest["rider_count"] += 1
+        manifest["paid_count" if paid else "unpaid_count"] += 1
+        manifest["collected"] += row.paid_this_term
+        manifest["outstanding"] += max(balance, 0)
 
-    return jsonify(result)
+    return jsonify({"term_id": term_id, "destinations": list(manifests.values())})
 
 @routes.route('/students-in-destination/<int:destination_id>', methods=['GET'])
+@query_budget(2)
 def get_students_in_destination(destination_id):
     destination = BusDestination.query.get(destination_id)
 
@@ -499,13 +930,40 @@ def add_gallery_item():
     })
 
 @routes.route('/notifications', methods=['GET'])
+@query_budget(2)
+@versioned_response(NOTIFICATIONS)
 def get_notifications():
-    notifications = Notification.query.all()
-    return jsonify([{
-        'id': notification.id,
-        'message': notification.message,
-        'date': notification.date
-    } for notification in notifications])
+    # ?since=<id> returns only newer notifications; otherwise the latest page
+    limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_NOTIFICATIONS_PAGE)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    since = request.args.get('since', type=int)
+    if since is not None:
+        notifications = notifications_after(since, limit)
+    else:
+        notifications = latest_notifications(limit)
+    return jsonify([notification_to_dict(notification) for notification in notifications])
+
+@routes.route('/notifications/stream', methods=['GET'])
+def stream_notifications():
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        # A fresh stream starts from now; GET /notifications serves the history
+        since = latest_notification_id()
+
+    config = app.config
+    if not stream_slots.acquire(config['NOTIFICATION_STREAM_MAX_CLIENTS']):
+        return jsonify({"error": "Too many open notification streams; retry shortly"}), 503, \
+            {'Retry-After': str(config['NOTIFICATION_POLL_SECONDS'])}
+
+    body = event_stream(since, config['NOTIFICATION_STREAM_SECONDS'],
+                        config['NOTIFICATION_POLL_SECONDS'], MAX_NOTIFICATIONS_PAGE)
+    response = Response(stream_with_context(body), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(stream_slots.release)
+    return response
 
 @routes.route('/notifications', methods=['POST'])
 def add_notification():
@@ -514,7 +972,9 @@ def add_notification():
 
     notification = Notification(message=message)
     db.session.add(notification)
+    bump_version(NOTIFICATIONS)
     db.session.commit()
+    broadcaster.publish(notification.id)
 
     return jsonify({
         'message': 'Notification added successfully',
@@ -524,19 +984,68 @@ def add_notification():
         }
     })
 
+def _enqueued(kind, label, **params):
+    job, created = enqueue(kind, **params)
+    if not created:
+        return jsonify({"error": f"A {label} is already {job.status}", "job_id": job.id}), 409
+    return jsonify({"message": f"{label.capitalize()} queued", "job_id": job.id}), 202
+
 @routes.route('/process-rollover', methods=['POST'])
 def process_rollover():
-    success = process_term_rollover()  # Call the rollover function
-    if success:
-        return jsonify({"message": "Term rollover processed successfully"}), 200
-    else:
-        return jsonify({"message": "No term found to process rollover"}), 400
+    return _enqueued('term_rollover', 'term rollover')
 
 @routes.route('/promote-students', methods=['POST'])
 
 def promote_students_route():
-    promote_students()  # Call the function for student promotion
-    return jsonify({"message": "students rollover was successfulll. congratulations 🎉"}),200
+    data = request.get_json(silent=True) or {}
+    if data.get('dry_run'):
+        summary = promote_students(dry_run=True)
+        return jsonify({"message": "Promotion preview", "summary": summary}), 200
+    return _enqueued('promote_students', 'student promotion')
+
+# Bill every active student for a term; runs as a background job
+@routes.route('/terms/<int:term_id>/billing', methods=['POST'])
+def bill_term(term_id):
+    if not db.session.get(Term, term_id):
+        return jsonify({"error": "Term not found"}), 404
+    return _enqueued('term_billing', 'term billing', term_id=term_id)
+
+# Latest billing run for a term, checked against its charge rows
+@routes.route('/terms/<int:term_id>/billing', methods=['GET'])
+@query_budget(2)
+def get_term_billing(term_id):
+    run = BillingRun.query.filter_by(term_id=term_id).order_by(BillingRun.id.desc()).first()
+    if not run:
+        return jsonify({"error": "Term has not been billed"}), 404
+
+    charges = charge_totals(term_id, billing_run_id=run.id)
+    recounted = sum(item["amount"] for item in charges.values())
+    return jsonify({
+        "billing_run": run.to_dict(),
+        "charges": charges,
+        "recounted_total": recounted,
+        "balanced": abs(recounted - run.total) < 0.005,
+    }), 200
+
+@routes.route('/jobs/<int:job_id>', methods=['GET'])
+@query_budget(1)
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@routes.route('/grades/progression', methods=['POST'])
+def set_grade_progression_route():
+    data = request.get_json(silent=True)
+    order = data.get('order') if isinstance(data, dict) else None
+
+    try:
+        set_grade_progression(order)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"message": "Grade progression saved successfully."}), 200
 
 # Route to add a grade
 @routes.route('/grades', methods=['POST'])
@@ -556,6 +1065,7 @@ def add_grade():
         # Add new grade
         grade = Grade(name=name)
         db.session.add(grade)
+        bump_version(GRADES)
         db.session.commit()
 
         return jsonify({"message": f"Grade '{name}' added successfully."}), 201
@@ -565,6 +1075,8 @@ def add_grade():
 
 # Route to get all grades
 @routes.route('/grades', methods=['GET'])
+@query_budget(2)
+@versioned_response(GRADES)
 def get_grades():
     try:
         grades = Grade.query.all()
@@ -575,17 +1087,18 @@ def get_grades():
         
 # 1. Get all fees
 @routes.route('/fees', methods=['GET'])
+@query_budget(3)
+@versioned_response(FEES)
 def get_all_fees():
-    fees = Fee.query.all()
-    result = [{"id": fee.id, "term_id": fee.term_id, "grade_id": fee.grade_id, "amount": fee.amount} for fee in fees]
-    return jsonify(result)
+    return jsonify(fee_structure().rows)
 
 # 2. Get fees for a specific grade and term
 @routes.route('/fees/<int:grade_id>/<int:term_id>', methods=['GET'])
+@query_budget(3)
 def get_fees_for_grade_and_term(grade_id, term_id):
-    fee = Fee.query.filter_by(grade_id=grade_id, term_id=term_id).first()
+    fee = fee_structure().fee(grade_id, term_id)
     if fee:
-        return jsonify({"id": fee.id, "term_id": fee.term_id, "grade_id": fee.grade_id, "amount": fee.amount})
+        return jsonify(fee)
     else:
         return jsonify({"message": "Fee not found for this grade and term"}), 404
 
@@ -605,6 +1118,7 @@ def add_fee():
 
     new_fee = Fee(term_id=term_id, grade_id=grade_id, amount=amount)
     db.session.add(new_fee)
+    bump_version(FEES)
     db.session.commit()
 
     return jsonify({"message": "Fee added successfully", "fee": {"id": new_fee.id, "term_id": new_fee.term_id, "grade_id": new_fee.grade_id, "amount": new_fee.amount}}), 201
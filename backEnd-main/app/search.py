@@ -0,0 +1,80 @@
+from app.models import db, Student
+from sqlalchemy import DDL, event, select, text, table, column, or_
+import re
+
+SEARCH_TABLE = 'student_search'
+# The trigram tokenizer matches any substring of at least this many characters
+MIN_TERM_LENGTH = 3
+
+# External-content FTS5 index over the searchable student columns. Triggers
+# keep it in step with every write, including Core bulk inserts; the update
+# trigger only fires when a searchable column changes, so balance updates
+# from payments never touch the index.
+SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, admission_number, phone,
+        content='student', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON student BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, name, admission_number, phone)
+        VALUES (new.id, new.name, new.admission_number, new.phone);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON student BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, admission_number, phone)
+        VALUES ('delete', old.id, old.name, old.admission_number, old.phone);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF name, admission_number, phone ON student BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, admission_number, phone)
+        VALUES ('delete', old.id, old.name, old.admission_number, old.phone);
+        INSERT INTO {SEARCH_TABLE}(rowid, name, admission_number, phone)
+        VALUES (new.id, new.name, new.admission_number, new.phone);
+    END""",
+]
+DROP_DDL = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+
+search_index = table(SEARCH_TABLE, column('rowid'))
+# Matches on the admission number rank above matches on name or phone
+MATCH = text(f"{SEARCH_TABLE} MATCH :query")
+RANK = text(f"bm25({SEARCH_TABLE}, 1.0, 4.0, 2.0)")
+
+for statement in SEARCH_DDL:
+    event.listen(Student.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Student.__table__, 'after_drop', DDL(DROP_DDL).execute_if(dialect='sqlite'))
+
+
+def search_terms(q):
+    """Words of q long enough for the trigram index; shorter words are ignored."""
+    terms = [term for term in re.split(r'\s+', q.strip()) if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        raise ValueError(f"Search terms need at least {MIN_TERM_LENGTH} characters")
+    return terms
+
+
+def match_query(terms):
+    """FTS5 query requiring every term as a substring of some searchable column."""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_students(q, columns, limit):
+    """
+    Return up to limit students matching every word of q, best match first, as
+    rows of the requested columns. SQLite uses the ranked FTS5 index; other
+    databases fall back to unranked substring matching.
+    """
+    terms = search_terms(q)
+    if db.engine.dialect.name == 'sqlite':
+        return db.session.execute(
+            select(*columns)
+            .select_from(search_index.join(Student, Student.id == search_index.c.rowid))
+            .where(MATCH)
+            .order_by(RANK)
+            .limit(limit),
+            {"query": match_query(terms)},
+        ).all()
+
+    query = select(*columns).order_by(Student.name).limit(limit)
+    for term in terms:
+        pattern = '%' + term.replace('%', r'\%').replace('_', r'\_') + '%'
+        query = query.where(or_(Student.name.ilike(pattern, escape='\\'),
+                                Student.admission_number.ilike(pattern, escape='\\'),
+                                Student.phone.like(pattern, escape='\\')))
+    return db.session.execute(query).all()
@@ -0,0 +1,204 @@
+# API benchmark: drives the hot endpoints through the Flask test client (or a
+# running server with --url), records latency percentiles, throughput and SQL
+# statements per request, and compares them against a JSON baseline. Timings are
+# kept as multiples of a reference request's median measured in the same run, so
+# the baseline holds on any machine. Run with `python -m benchmarks.api [--update-baseline]`.
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+from app import create_app, db
+from benchmarks.fixtures import make_config, load_school, count_statements
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# A cheap cached read whose median is the unit for every other timing
+REFERENCE = ("GET", "/terms")
+# Reference requests sent before each scenario; pooling them follows any drift
+# in machine speed over the run
+REFERENCE_SAMPLES = 25
+# Extra time allowed on top of the tolerance, in reference medians, so jitter on
+# the fastest endpoints does not read as a regression
+REFERENCE_SLACK = 1.0
+# Below this many requests a p95 is just the slowest one, so the median is compared
+MIN_P95_REQUESTS = 50
+
+
+def scenarios(num_students):
+    """(name, method, path, body factory, iterations); mutating jobs run fewer times."""
+    return [
+        ("login", "POST", "/login",
+         lambda i: {"identifier": f"ADM{i % num_students + 1:07d}", "password": "student"}, 20),
+        ("students page", "GET", "/students?limit=50&fields=id,name,balance", None, None),
+        ("students filtered", "GET", "/students?use_bus=true&min_balance=1000", None, None),
+        ("student search", "GET", "/students/search?q=0001234", None, None),
+        ("add payment", "POST", "/payments",
+         lambda i: {"student_id": i % num_students + 1, "amount": 100, "method": "mpesa", "term_id": 1}, None),
+        ("students with destinations", "GET", "/students-with-destinations", None, 20),
+        ("bus manifests", "GET", "/bus/manifests?term_id=1", None, None),
+        ("fees", "GET", "/fees", None, None),
+        ("finance dashboard", "GET", "/dashboard/finance?term_id=1", None, None),
+        # Rollover and promotion only enqueue a job now; repeats answer 409
+        ("queue term rollover", "POST", "/process-rollover", None, 5),
+        ("queue promotion", "POST", "/promote-students", None, 5),
+        ("job status", "GET", "/jobs/1", None, None),
+    ]
+
+
+class LocalClient:
+    """Test-client driver that also counts SQL statements per request."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        with app.app_context():
+            self.engine = db.engine
+
+    def request(self, method, path, body):
+        # No outer app context, so each request gets a fresh flask.g
+        with count_statements(self.engine) as statements:
+            response = self.client.open(path, method=method, json=body)
+            response.get_data()
+        return response.status_code, len(statements)
+
+
+class HttpClient:
+    """Driver for a live server, e.g. a local gunicorn; SQL counts are unavailable."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def run_scenario(client, method, path, body, iterations):
+    latencies = []
+    statements = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        payload = body(i) if body else None
+        request_started = time.perf_counter()
+        status, count = client.request(method, path, payload)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        if status >= 500:
+            errors += 1
+        if count is not None:
+            statements.append(count)
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": iterations,
+        "errors": errors,
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "rps": round(iterations / elapsed, 1),
+        "statements": max(statements) if statements else None,
+    }
+
+
+def add_ratios(result, reference_ms):
+    """Express the result's median and p95 in units of the reference median."""
+    result["p50_ratio"] = round(result["p50_ms"] / reference_ms, 2)
+    result["p95_ratio"] = round(result["p95_ms"] / reference_ms, 2)
+
+
+def baseline_entry(result):
+    """What the baseline keeps: counts and ratios, not this machine's milliseconds."""
+    return {key: result[key] for key in ("requests", "statements", "p50_ratio", "p95_ratio")}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        measure = "p95" if result["requests"] >= MIN_P95_REQUESTS else "p50"
+        key = f"{measure}_ratio"
+        if result[key] > previous[key] * (1 + tolerance) + REFERENCE_SLACK:
+            regressions.append(f"{name}: {measure} {previous[key]}x -> {result[key]}x the reference median")
+        if None not in (result["statements"], previous["statements"]) and result["statements"] > previous["statements"]:
+            regressions.append(f"{name}: statements {previous['statements']} -> {result['statements']}")
+        if result["errors"]:
+            regressions.append(f"{name}: {result['errors']} server errors")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot API endpoints.")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--payments-per-student", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="iterations per read endpoint")
+    parser.add_argument("--url", help="benchmark a running server instead of the test client")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p95 slowdown relative to the reference request, as a fraction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            client = HttpClient(args.url)
+        else:
+            app = create_app(make_config(os.path.join(tmp, "bench.db")))
+            with app.app_context():
+                db.create_all()
+                load_school(args.students, payments_per_student=args.payments_per_student)
+            client = LocalClient(app)
+
+        results = {}
+        reference_latencies = []
+        reference_method, reference_path = REFERENCE
+        for name, method, path, body, iterations in scenarios(args.students):
+            for _ in range(REFERENCE_SAMPLES):
+                started = time.perf_counter()
+                client.request(reference_method, reference_path, None)
+                reference_latencies.append((time.perf_counter() - started) * 1000)
+            results[name] = run_scenario(client, method, path, body, iterations or args.requests)
+
+        reference_ms = statistics.median(reference_latencies)
+        print(f"reference {reference_method} {reference_path}: median {reference_ms:.2f}ms")
+        print(f"{'endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'SQL':>5} {'p95 x':>7}")
+        for name, result in results.items():
+            add_ratios(result, reference_ms)
+            print(f"{name:<28} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                  f"{result['rps']:>8.1f} {result['statements'] if result['statements'] is not None else '-':>5} "
+                  f"{result['p95_ratio']:>7.1f}")
+
+        if not args.url:
+            with app.app_context():
+                db.engine.dispose()
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump({name: baseline_entry(result) for name, result in results.items()}, f, indent=2, sort_keys=True)
+        print(f"Wrote baseline to {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Term billing benchmark: times billing.run_term_billing against growing schools,
+# counts the SQL statements it issues and checks the run's total against its
+# charge rows. Run with `python -m benchmarks.billing`.
+import os
+import tempfile
+import time
+
+from app import create_app, db
+from app.billing import run_term_billing, charge_totals
+from benchmarks.fixtures import make_config, load_school, count_statements
+
+SIZES = [1000, 5000, 20000, 50000]
+
+
+def run(num_students):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, "bench.db")))
+        with app.app_context():
+            db.create_all()
+            load_school(num_students)
+
+            with count_statements(db.engine) as statements:
+                started = time.perf_counter()
+                summary = run_term_billing(1)
+                elapsed = time.perf_counter() - started
+            recounted = sum(item["amount"] for item in charge_totals(1, summary["id"]).values())
+            db.engine.dispose()
+
+    return elapsed, len(statements), summary, recounted
+
+
+def main():
+    print(f"{'students':>9} {'seconds':>9} {'us/student':>11} {'statements':>11} {'charges':>9}")
+    for size in SIZES:
+        elapsed, statements, summary, recounted = run(size)
+        assert summary["students_billed"] == size
+        assert abs(recounted - summary["total"]) < 0.005
+        print(f"{size:>9} {elapsed:>9.3f} {elapsed / size * 1e6:>11.2f} {statements:>11} {summary['charge_count']:>9}")
+
+
+if __name__ == "__main__":
+    main()
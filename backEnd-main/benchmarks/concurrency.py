@@ -0,0 +1,137 @@
+# Lost-update stress test: several worker processes, each with its own app and
+# engine like gunicorn workers, post unit payments to the same student through
+# every payment route at once. Afterwards the balances, the term summary and
+# the balance_after_payment trail must account for every accepted payment.
+# Run with `python -m benchmarks.concurrency [--workers 8 --payments 50 --group-commit]`.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select, update, func
+
+from app import create_app, db
+from app.models import Student, Payment, BusPayment, StudentTermBalance
+from benchmarks.fixtures import make_config, load_school
+
+STUDENT_ID = 1
+TERM_ID = 1
+OPENING_BALANCE = 1_000_000.0
+BATCH_SIZE = 5
+
+
+def requests_for(worker, payments):
+    """A worker's mix of routes; every request moves a balance by 1 per payment."""
+    for i in range(payments):
+        route = (worker + i) % 4
+        if route == 0:
+            yield "fee", 1, "/payments", {"student_id": STUDENT_ID, "amount": 1, "method": "mpesa",
+                                          "term_id": TERM_ID}
+        elif route == 1:
+            yield "fee", BATCH_SIZE, "/payments/batch", [
+                {"student_id": STUDENT_ID, "amount": 1, "method": "bank", "term_id": TERM_ID}
+            ] * BATCH_SIZE
+        elif route == 2:
+            yield "fee", 1, f"/students/{STUDENT_ID}/update-balance", {"payment_amount": 1, "term_id": TERM_ID}
+        else:
+            yield "bus", 1, "/bus-payments", {"student_id": STUDENT_ID, "amount": 1, "term_id": TERM_ID}
+
+
+def worker(path, index, payments, group_commit, start, results):
+    app = create_app(make_config(path, METRICS_ENABLED=False, GROUP_COMMIT=group_commit))
+    client = app.test_client()
+    posted = {"fee": 0, "bus": 0, "errors": 0}
+    start.wait()
+    for kind, count, url, body in requests_for(index, payments):
+        response = client.post(url, json=body)
+        if response.status_code in (200, 201):
+            posted[kind] += count
+        else:
+            posted["errors"] += 1
+    results.put(posted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check concurrent payment posting for lost updates.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--payments", type=int, default=50, help="requests per worker")
+    parser.add_argument("--group-commit", action="store_true", help="post through the group commit path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        app = create_app(make_config(path, METRICS_ENABLED=False))
+        with app.app_context():
+            db.create_all()
+            load_school(10)
+            db.session.execute(
+                update(Student).where(Student.id == STUDENT_ID)
+                .values(balance=OPENING_BALANCE, bus_balance=OPENING_BALANCE, arrears=0)
+            )
+            db.session.commit()
+            paid_before = db.session.execute(
+                select(func.coalesce(func.sum(StudentTermBalance.paid), 0))
+                .where(StudentTermBalance.student_id == STUDENT_ID, StudentTermBalance.term_id == TERM_ID)
+            ).scalar()
+            last_payment_id = db.session.execute(select(func.coalesce(func.max(Payment.id), 0))).scalar()
+            db.engine.dispose()
+
+        context = multiprocessing.get_context("fork")
+        start = context.Event()
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(path, index, args.payments, args.group_commit, start, results))
+                     for index in range(args.workers)]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start.set()
+        posted = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        fee_posted = sum(item["fee"] for item in posted)
+        bus_posted = sum(item["bus"] for item in posted)
+        errors = sum(item["errors"] for item in posted)
+
+        with app.app_context():
+            student = db.session.get(Student, STUDENT_ID)
+            trail = sorted(db.session.execute(
+                select(Payment.balance_after_payment)
+                .where(Payment.student_id == STUDENT_ID, Payment.id > last_payment_id)
+            ).scalars(), reverse=True)
+            bus_payments = db.session.execute(
+                select(func.count(BusPayment.id)).where(BusPayment.student_id == STUDENT_ID)
+            ).scalar()
+            paid = db.session.execute(
+                select(StudentTermBalance.paid)
+                .where(StudentTermBalance.student_id == STUDENT_ID, StudentTermBalance.term_id == TERM_ID)
+            ).scalar()
+            checks = {
+                "fee balance": (student.balance, OPENING_BALANCE - fee_posted),
+                "bus balance": (student.bus_balance, OPENING_BALANCE - bus_posted),
+                "payments recorded": (len(trail), fee_posted),
+                # Each payment must have seen its own, distinct post-payment balance
+                "balance_after_payment trail": (trail, [OPENING_BALANCE - n for n in range(1, fee_posted + 1)]),
+                "term summary paid": (paid - paid_before, fee_posted),
+            }
+            db.engine.dispose()
+
+    requests = args.workers * args.payments
+    print(f"{args.workers} workers, {requests} requests, {fee_posted} fee and {bus_posted} bus payments "
+          f"in {elapsed:.2f}s ({requests / elapsed:.0f} req/s), {errors} failed requests, "
+          f"{bus_payments} bus payment rows")
+    failures = [name for name, (actual, expected) in checks.items() if actual != expected]
+    for name, (actual, expected) in checks.items():
+        if name in failures and not isinstance(actual, list):
+            print(f"FAIL {name}: {actual} != {expected}")
+        else:
+            print(f"{'FAIL' if name in failures else 'ok  '} {name}")
+    if failures or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Database configuration benchmark: forked reader and writer processes, each
+# with its own app and engine like gunicorn workers, hammer one database for a
+# fixed time. Readers fetch student pages, term balances and bus destinations
+# while writers post payments. Reports reads/s, writes/s, read p95 and failed
+# requests for SQLite's default journal settings against the WAL tuning in
+# Config, and for PostgreSQL when --postgres-url names a scratch database (its
+# tables are dropped and recreated).
+# Run with `python -m benchmarks.database [--readers 4 --writers 2 --seconds 5]`.
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app import create_app, db
+from benchmarks.fixtures import make_config, load_school
+
+TERM_ID = 1
+# SQLite's own defaults: rollback journal, fsync on every commit, no mmap
+SQLITE_DEFAULTS = dict(SQLITE_JOURNAL_MODE='DELETE', SQLITE_SYNCHRONOUS='FULL', SQLITE_MMAP_SIZE=0)
+
+
+def configurations(tmp, postgres_url):
+    yield "sqlite default", make_config(os.path.join(tmp, "default.db"), METRICS_ENABLED=False, **SQLITE_DEFAULTS)
+    yield "sqlite wal full", make_config(os.path.join(tmp, "wal_full.db"), METRICS_ENABLED=False,
+                                         SQLITE_SYNCHRONOUS='FULL')
+    yield "sqlite wal", make_config(os.path.join(tmp, "wal.db"), METRICS_ENABLED=False)
+    if postgres_url:
+        yield "postgresql", make_config(None, METRICS_ENABLED=False, SQLALCHEMY_DATABASE_URI=postgres_url)
+
+
+def read_request(client, students):
+    student_id = random.randint(1, students)
+    kind = random.randrange(3)
+    if kind == 0:
+        return client.get(f"/get_student_bus_destinations/{student_id}")
+    if kind == 1:
+        return client.get(f"/students/{student_id}/balances/{TERM_ID}")
+    return client.get(f"/students?limit=50&offset={random.randrange(students)}")
+
+
+def write_request(client, students):
+    return client.post("/payments", json={"student_id": random.randint(1, students), "amount": 1,
+                                          "method": "mpesa", "term_id": TERM_ID})
+
+
+def worker(config, role, students, seconds, start, results):
+    app = create_app(config)
+    client = app.test_client()
+    request = read_request if role == "read" else write_request
+    latencies = []
+    errors = 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        response = request(client, students)
+        response.get_data()
+        latencies.append(time.perf_counter() - began)
+        if response.status_code not in (200, 201):
+            errors += 1
+    results.put((role, latencies, errors))
+
+
+def run(config, readers, writers, students, seconds):
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        load_school(students, payments_per_student=2)
+        db.engine.dispose()
+
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+    results = context.Queue()
+    roles = ["read"] * readers + ["write"] * writers
+    processes = [context.Process(target=worker, args=(config, role, students, seconds, start, results))
+                 for role in roles]
+    for process in processes:
+        process.start()
+    start.set()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    totals = {"read": [], "write": []}
+    errors = 0
+    for role, latencies, failed in collected:
+        totals[role].extend(latencies)
+        errors += failed
+    reads = sorted(totals["read"])
+    p95 = reads[int(len(reads) * 0.95) - 1] * 1000 if reads else 0.0
+    return len(totals["read"]) / seconds, len(totals["write"]) / seconds, p95, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare read/write throughput across database configurations.")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--postgres-url", help="scratch PostgreSQL database to include; its tables are dropped")
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.students} students, {args.seconds:g}s each")
+    print(f"{'configuration':<18}{'reads/s':>9}{'writes/s':>10}{'read p95 ms':>13}{'errors':>8}")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, config in configurations(tmp, args.postgres_url):
+            reads, writes, p95, errors = run(config, args.readers, args.writers, args.students, args.seconds)
+            print(f"{label:<18}{reads:>9.0f}{writes:>10.0f}{p95:>13.1f}{errors:>8}")
+            failed = failed or errors > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Shared benchmark fixtures: a throwaway SQLite app and a bulk-loaded school.
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.config import Config
+from seed import generate_school, TERM_DAYS
+
+
+def make_config(path, **overrides):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+    for key, value in overrides.items():
+        setattr(BenchConfig, key, value)
+    return BenchConfig
+
+
+def load_school(num_students, payments_per_student=0):
+    """Generate a school whose first term has just ended and whose second is about to start."""
+    generate_school(
+        num_students=num_students,
+        num_terms=2,
+        payments_per_student=payments_per_student,
+        start_date=date.today() - timedelta(days=TERM_DAYS + 10),
+    )
+
+
+@contextmanager
+def count_statements(engine):
+    """Collect every SQL statement the engine executes inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
@@ -0,0 +1,145 @@
+# Compare per-request commits with GROUP_COMMIT for POST /payments and
+# POST /bus-payments. Client threads share one app, like a threaded gunicorn
+# worker, and each posts to its own student; a few requests name an unknown
+# student and must still get their own 404. Reports throughput, latency,
+# commits issued and checks every accepted payment reached the balances.
+# Run with `python -m benchmarks.group_commit [--threads 16 --requests 50]`.
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event, select, update, func
+
+from app import create_app, db
+from app.models import Student, Payment, BusPayment
+from benchmarks.fixtures import make_config, load_school
+
+TERM_ID = 1
+OPENING_BALANCE = 1_000_000.0
+UNKNOWN_STUDENT = 10 ** 9
+# Every this-many requests names a student that does not exist
+REJECT_EVERY = 25
+
+
+def requests_for(thread, count):
+    student_id = thread + 1
+    for i in range(count):
+        target = UNKNOWN_STUDENT if i % REJECT_EVERY == REJECT_EVERY - 1 else student_id
+        if i % 2:
+            yield "bus", "/bus-payments", {"student_id": target, "amount": 1, "term_id": TERM_ID}
+        else:
+            yield "fee", "/payments", {"student_id": target, "amount": 1, "method": "mpesa", "term_id": TERM_ID}
+
+
+def run(group_commit, threads, count, window_ms):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "group_commit.db")
+        app = create_app(make_config(path, METRICS_ENABLED=False, GROUP_COMMIT=group_commit,
+                                     GROUP_COMMIT_WINDOW_MS=window_ms))
+        with app.app_context():
+            db.create_all()
+            load_school(threads)
+            db.session.execute(
+                update(Student).values(balance=OPENING_BALANCE, bus_balance=OPENING_BALANCE, arrears=0)
+            )
+            db.session.commit()
+            payments_before = db.session.execute(select(func.count(Payment.id))).scalar()
+            bus_payments_before = db.session.execute(select(func.count(BusPayment.id))).scalar()
+            engine = db.engine
+
+        commits = []
+        event.listen(engine, "commit", lambda conn: commits.append(1))
+
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        start = threading.Barrier(threads + 1)
+
+        def client_thread(index):
+            client = app.test_client()
+            mine = []
+            seen = {}
+            start.wait()
+            for kind, url, body in requests_for(index, count):
+                began = time.perf_counter()
+                response = client.post(url, json=body)
+                mine.append(time.perf_counter() - began)
+                key = (kind, body["student_id"] != UNKNOWN_STUDENT, response.status_code)
+                seen[key] = seen.get(key, 0) + 1
+            with lock:
+                latencies.extend(mine)
+                for key, value in seen.items():
+                    statuses[key] = statuses.get(key, 0) + value
+
+        workers = [threading.Thread(target=client_thread, args=(index,)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            student_ids = list(range(1, threads + 1))
+            balances = db.session.execute(
+                select(func.sum(Student.balance), func.sum(Student.bus_balance))
+                .where(Student.id.in_(student_ids))
+            ).one()
+            payments = db.session.execute(select(func.count(Payment.id))).scalar() - payments_before
+            bus_payments = db.session.execute(select(func.count(BusPayment.id))).scalar() - bus_payments_before
+            db.engine.dispose()
+
+    accepted = {kind: sum(n for (k, known, status), n in statuses.items() if k == kind and known and status in (200, 201))
+                for kind in ("fee", "bus")}
+    rejected = sum(n for (k, known, status), n in statuses.items() if not known and status == 404)
+    expected_rejections = sum(1 for i in range(count) if i % REJECT_EVERY == REJECT_EVERY - 1) * threads
+    opening = OPENING_BALANCE * threads
+    checks = {
+        "fee balances": (balances[0], opening - accepted["fee"]),
+        "bus balances": (balances[1], opening - accepted["bus"]),
+        "payment rows": (payments, accepted["fee"]),
+        "bus payment rows": (bus_payments, accepted["bus"]),
+        "unknown students rejected": (rejected, expected_rejections),
+        "every request answered": (sum(statuses.values()), threads * count),
+    }
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "requests": threads * count,
+        "commits": len(commits),
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "failures": [name for name, (actual, expected) in checks.items() if actual != expected],
+        "checks": checks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request commits vs group commit for payment posting.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="requests per thread")
+    parser.add_argument("--window-ms", type=float, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.requests} requests, window {args.window_ms:g}ms")
+    print(f"{'mode':<12}{'req/s':>8}{'commits':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    failed = False
+    for label, group_commit in (("per-request", False), ("group", True)):
+        result = run(group_commit, args.threads, args.requests, args.window_ms)
+        print(f"{label:<12}{result['requests'] / result['elapsed']:>8.0f}{result['commits']:>9}"
+              f"{result['p50']:>9.1f}{result['p95']:>9.1f}")
+        for name in result["failures"]:
+            actual, expected = result["checks"][name]
+            print(f"  FAIL {name}: {actual} != {expected}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
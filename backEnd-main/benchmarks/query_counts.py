@@ -0,0 +1,84 @@
+# Query-count guard: requests each listed endpoint against schools of two sizes
+# with app.querywatch enabled. Fails if a route exceeds the budget it declares
+# with @query_budget, repeats a statement shape (N+1), or issues more
+# statements as the school grows. Run with `python -m benchmarks.query_counts`.
+import os
+import sys
+import tempfile
+
+from app import create_app, db, querywatch
+from benchmarks.fixtures import make_config, load_school, count_statements
+
+SIZES = [10, 200]
+
+ENDPOINTS = [
+    ("GET", "/students", None),
+    ("GET", "/students?use_bus=true&fields=id,name,bus_balance", None),
+    ("GET", "/students/search?q=Student", None),
+    ("GET", "/students-with-destinations", None),
+    ("GET", "/students-in-destination/1", None),
+    ("GET", "/get_student_bus_destinations/1", None),
+    ("GET", "/bus/manifests?term_id=1", None),
+    ("GET", "/students/1/balances/1", None),
+    ("GET", "/reports/terms/1", None),
+    ("GET", "/exports/payments", None),
+    ("GET", "/terms", None),
+    ("GET", "/grades", None),
+    ("GET", "/notifications", None),
+    ("GET", "/fees", None),
+    ("GET", "/fees/1/1", None),
+    ("GET", "/dashboard/finance?term_id=1", None),
+    ("POST", "/payments", {"student_id": 1, "amount": 100, "method": "mpesa", "term_id": 1}),
+    ("POST", "/payments/batch", [{"student_id": i, "amount": 100, "method": "mpesa", "term_id": 1}
+                                 for i in range(1, 11)]),
+    # Second read folds in only the payments posted above
+    ("GET", "/dashboard/finance?term_id=1&refresh", None),
+]
+
+
+def measure(num_students):
+    counts = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, "bench.db"), QUERY_WATCH=True))
+        with app.app_context():
+            db.create_all()
+            load_school(num_students, payments_per_student=2)
+            engine = db.engine
+
+        client = app.test_client()
+        querywatch.recent_reports.clear()
+        for method, path, body in ENDPOINTS:
+            with count_statements(engine) as statements:
+                response = client.open(path, method=method, json=body)
+                response.get_data()  # drain streamed bodies
+            counts[(method, path)] = len(statements)
+        engine.dispose()
+    return counts, list(querywatch.recent_reports)
+
+
+def main():
+    (small, _), (large, reports) = (measure(size) for size in SIZES)
+    failures = []
+    for method, path, _ in ENDPOINTS:
+        key = (method, path)
+        print(f"{method} {path}: {small[key]} statements at {SIZES[0]} students, {large[key]} at {SIZES[1]}")
+        if large[key] > small[key]:
+            failures.append(f"{method} {path}: statement count grows with the number of students")
+
+    for report in reports:
+        if report["budget"] is not None and report["statements"] > report["budget"]:
+            failures.append(f"{report['method']} {report['route']}: {report['statements']} statements, "
+                            f"budget {report['budget']}")
+        for item in report["repeated"]:
+            failures.append(f"{report['method']} {report['route']}: repeated {item['count']}x from "
+                            f"{', '.join(item['call_sites'])}: {item['statement']}")
+
+    if failures:
+        print("Query count regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Query-plan guard: builds a database from the Alembic migrations, runs EXPLAIN
+# QUERY PLAN on each hot lookup and fails if any falls back to a table scan.
+# Run with `python -m benchmarks.query_plans`.
+import os
+import sys
+import tempfile
+
+from flask_migrate import upgrade
+from sqlalchemy import select, text, update
+
+from app import create_app, db
+from app.models import Student, Payment, Fee, BusPayment, StudentTermBalance, Charge
+from benchmarks.fixtures import make_config
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+# (description, statement, tables allowed to be scanned)
+HOT_QUERIES = [
+    ("login by admission number",
+     select(Student).where(Student.admission_number == "ADM000001"), set()),
+    ("payments for a student",
+     select(Payment).where(Payment.student_id == 1), set()),
+    ("bus payments for a student and term",
+     select(BusPayment).where(BusPayment.student_id == 1, BusPayment.term_id == 1), set()),
+    ("bus payments for a term",
+     select(BusPayment).where(BusPayment.term_id == 1), set()),
+    ("payments export for a term",
+     select(Payment).where(Payment.term_id == "1").order_by(Payment.id), set()),
+    ("fee for a grade and term",
+     select(Fee.amount).where(Fee.grade_id == 1, Fee.term_id == 1), set()),
+    ("students on a bus route",
+     select(Student).where(Student.bus_destination_id == 1), set()),
+    ("students page filtered by grade",
+     select(Student.id, Student.name).where(Student.grade_id == 1, Student.id > 0)
+     .order_by(Student.id).limit(50), set()),
+    ("term balance for a student",
+     select(StudentTermBalance).where(StudentTermBalance.student_id == 1, StudentTermBalance.term_id == 1), set()),
+    ("term report totals",
+     select(StudentTermBalance.paid).where(StudentTermBalance.term_id == 1), set()),
+    ("dashboard payments since the last read",
+     select(Payment.amount).where(Payment.id > 1000, Payment.id <= 2000), set()),
+    ("dashboard bus payments since the last read",
+     select(BusPayment.amount).where(BusPayment.id > 1000, BusPayment.id <= 2000), set()),
+    ("billing charges for a student and term",
+     select(Charge.amount).where(Charge.student_id == 1, Charge.term_id == 1, Charge.kind.in_(["tuition", "boarding"])),
+     set()),
+    # The rollover touches every student by design; only the fee lookup must be indexed
+    ("rollover fee lookup",
+     update(Student).values(term_fee=select(Fee.amount)
+                            .where(Fee.grade_id == Student.grade_id, Fee.term_id == 2)
+                            .scalar_subquery()), {"student"}),
+]
+
+
+def table_scans(detail):
+    """Return the table named by a 'SCAN <table>' plan step, if any."""
+    if not detail.startswith("SCAN "):
+        return None
+    table = detail.split()[1]
+    return None if table in ("CONSTANT", "SUBQUERY") else table
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, "plans.db")))
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+            for description, statement, allowed in HOT_QUERIES:
+                sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+                plan = [row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+                scanned = {table_scans(step) for step in plan} - {None} - allowed
+                print(f"{'FAIL' if scanned else 'ok  '} {description}: {' | '.join(plan)}")
+                if scanned:
+                    failures.append(description)
+            db.engine.dispose()
+
+    if failures:
+        print("Table scans in hot queries:", ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Term rollover benchmark: times jobs.process_term_rollover against growing schools,
+# counts the SQL statements it issues and the longest gap between chunk commits
+# (how long a payment may wait for SQLite's write lock). Also checks that billing
+# the next term before or after rolling into it leaves the same balances and term
+# summaries as the rollover alone. Run with `python -m benchmarks.rollover`.
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select
+
+from app import create_app, db
+from app.billing import run_term_billing
+from app.jobs import process_term_rollover
+from app.models import Student, StudentTermBalance
+from benchmarks.fixtures import make_config, load_school, count_statements
+
+SIZES = [1000, 5000, 20000, 50000]
+ORDERS = {
+    "rollover only": ("rollover",),
+    "bill, then rollover": ("bill", "rollover"),
+    "rollover, then bill": ("rollover", "bill"),
+}
+NEXT_TERM = 2
+
+
+def run(num_students):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, "bench.db")))
+        with app.app_context():
+            db.create_all()
+            load_school(num_students)
+
+            commits = []
+            with count_statements(db.engine) as statements:
+                started = time.perf_counter()
+                summary = process_term_rollover(progress=lambda done, total: commits.append(time.perf_counter()))
+                elapsed = time.perf_counter() - started
+            db.engine.dispose()
+
+    longest_chunk = max(later - earlier for earlier, later in zip([started] + commits, commits))
+    return elapsed, len(statements), longest_chunk, summary
+
+
+def end_state(steps, num_students):
+    """Balances and next-term summaries after running steps on a fresh school."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, "order.db")))
+        with app.app_context():
+            db.create_all()
+            load_school(num_students, payments_per_student=2)
+            for step in steps:
+                if step == "bill":
+                    run_term_billing(NEXT_TERM)
+                else:
+                    process_term_rollover(chunk_size=97)
+            students = db.session.execute(
+                select(Student.id, Student.balance, Student.bus_balance, Student.arrears).order_by(Student.id)
+            ).all()
+            summaries = db.session.execute(
+                select(StudentTermBalance.student_id, StudentTermBalance.arrears_brought_forward,
+                       StudentTermBalance.billed, StudentTermBalance.bus_billed)
+                .where(StudentTermBalance.term_id == NEXT_TERM)
+                .order_by(StudentTermBalance.student_id)
+            ).all()
+            db.engine.dispose()
+    return [tuple(row) for row in students], [tuple(row) for row in summaries]
+
+
+def check_billing_order(num_students=500):
+    expected = end_state(ORDERS["rollover only"], num_students)
+    failed = False
+    for label, steps in ORDERS.items():
+        ok = end_state(steps, num_students) == expected
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+        failed = failed or not ok
+    return not failed
+
+
+def main():
+    print(f"{'students':>9} {'seconds':>9} {'us/student':>11} {'statements':>11} {'max chunk ms':>13}")
+    for size in SIZES:
+        elapsed, statements, longest_chunk, summary = run(size)
+        assert summary["students_rolled_over"] == size
+        print(f"{size:>9} {elapsed:>9.3f} {elapsed / size * 1e6:>11.2f} {statements:>11} {longest_chunk * 1000:>13.1f}")
+    if not check_billing_order():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
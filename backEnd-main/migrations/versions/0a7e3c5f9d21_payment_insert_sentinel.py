@@ -0,0 +1,26 @@
+"""payment insert sentinel
+
+Revision ID: 0a7e3c5f9d21
+Revises: f6c2a8d4b019
+Create Date: 2026-10-19 14:02:51.730418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7e3c5f9d21'
+down_revision = 'f6c2a8d4b019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sentinel', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_column('sentinel')
@@ -0,0 +1,36 @@
+"""grade progression
+
+Revision ID: 3a9c51d2e7b4
+Revises: eff13fc2c83c
+Create Date: 2026-10-18 09:12:40.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9c51d2e7b4'
+down_revision = 'eff13fc2c83c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_grade_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('graduating', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_foreign_key('fk_grade_next_grade_id_grade', 'grade', ['next_grade_id'], ['id'])
+
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+
+def downgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.drop_column('is_active')
+
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_grade_next_grade_id_grade', type_='foreignkey')
+        batch_op.drop_column('graduating')
+        batch_op.drop_column('next_grade_id')
@@ -0,0 +1,86 @@
+"""student term balance summary
+
+Revision ID: 5e0b3d8c71fa
+Revises: c2f7e9a41b30
+Create Date: 2026-10-18 12:03:15.671240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0b3d8c71fa'
+down_revision = 'c2f7e9a41b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('student_term_balance',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('term_id', sa.Integer(), nullable=False),
+    sa.Column('arrears_brought_forward', sa.Float(), nullable=False),
+    sa.Column('billed', sa.Float(), nullable=False),
+    sa.Column('paid', sa.Float(), nullable=False),
+    sa.Column('payment_count', sa.Integer(), nullable=False),
+    sa.Column('bus_billed', sa.Float(), nullable=False),
+    sa.Column('bus_paid', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['student.id'], ),
+    sa.ForeignKeyConstraint(['term_id'], ['term.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'term_id')
+    )
+    with op.batch_alter_table('student_term_balance', schema=None) as batch_op:
+        batch_op.create_index('ix_student_term_balance_term_id', ['term_id'], unique=False)
+
+    # Backfill the payment totals from the existing ledger
+    op.execute("""
+        INSERT INTO student_term_balance
+            (student_id, term_id, arrears_brought_forward, billed, paid, payment_count, bus_billed, bus_paid)
+        SELECT student_id, term_id, 0, 0, SUM(paid), SUM(payment_count), 0, SUM(bus_paid)
+        FROM (
+            SELECT student_id, CAST(term_id AS INTEGER) AS term_id, amount AS paid,
+                   1 AS payment_count, 0 AS bus_paid
+            FROM payment
+            UNION ALL
+            SELECT student_id, term_id, 0, 0, amount
+            FROM bus_payment
+        ) AS ledger
+        GROUP BY student_id, term_id
+    """)
+
+    # Open the current term for every student from their balance columns:
+    # arrears were brought forward and the rest of the balance, plus what has
+    # been paid this term, is what the term billed
+    current_term = "(SELECT id FROM term WHERE start_date <= CURRENT_DATE ORDER BY start_date DESC LIMIT 1)"
+    op.execute(f"""
+        INSERT INTO student_term_balance
+            (student_id, term_id, arrears_brought_forward, billed, paid, payment_count, bus_billed, bus_paid)
+        SELECT student.id, current_term.id, 0, 0, 0, 0, 0, 0
+        FROM student, {current_term} AS current_term
+        WHERE NOT EXISTS (
+            SELECT 1 FROM student_term_balance
+            WHERE student_term_balance.student_id = student.id
+              AND student_term_balance.term_id = current_term.id
+        )
+    """)
+    op.execute(f"""
+        UPDATE student_term_balance SET
+            arrears_brought_forward = COALESCE((
+                SELECT student.arrears FROM student
+                WHERE student.id = student_term_balance.student_id), 0),
+            billed = paid + COALESCE((
+                SELECT COALESCE(student.balance, 0) - COALESCE(student.arrears, 0) FROM student
+                WHERE student.id = student_term_balance.student_id), 0),
+            bus_billed = bus_paid + COALESCE((
+                SELECT student.bus_balance FROM student
+                WHERE student.id = student_term_balance.student_id), 0)
+        WHERE term_id = {current_term}
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('student_term_balance', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_term_balance_term_id')
+
+    op.drop_table('student_term_balance')
@@ -0,0 +1,55 @@
+"""student search index
+
+Revision ID: 7b3f0e5a9c12
+Revises: e4b82d6c1f37
+Create Date: 2026-10-18 16:40:52.219804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3f0e5a9c12'
+down_revision = 'e4b82d6c1f37'
+branch_labels = None
+depends_on = None
+
+# The index as this revision creates it, copied from app/search.py. Migrations
+# keep their own copy so later changes to the app never alter what they build
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS student_search USING fts5(
+        name, admission_number, phone,
+        content='student', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS student_search_ai AFTER INSERT ON student BEGIN
+        INSERT INTO student_search(rowid, name, admission_number, phone)
+        VALUES (new.id, new.name, new.admission_number, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS student_search_ad AFTER DELETE ON student BEGIN
+        INSERT INTO student_search(student_search, rowid, name, admission_number, phone)
+        VALUES ('delete', old.id, old.name, old.admission_number, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS student_search_au AFTER UPDATE OF name, admission_number, phone ON student BEGIN
+        INSERT INTO student_search(student_search, rowid, name, admission_number, phone)
+        VALUES ('delete', old.id, old.name, old.admission_number, old.phone);
+        INSERT INTO student_search(rowid, name, admission_number, phone)
+        VALUES (new.id, new.name, new.admission_number, new.phone);
+    END""",
+]
+
+
+def upgrade():
+    # FTS5 is SQLite-only; other databases fall back to substring ILIKE matching
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in SEARCH_DDL:
+        op.execute(statement)
+    op.execute("INSERT INTO student_search(student_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for trigger in ('student_search_au', 'student_search_ad', 'student_search_ai'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS student_search")
@@ -0,0 +1,28 @@
+"""change counters
+
+Revision ID: 8d14f0b6a2c9
+Revises: 3a9c51d2e7b4
+Create Date: 2026-10-18 10:41:07.553912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d14f0b6a2c9'
+down_revision = '3a9c51d2e7b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('change_counter')
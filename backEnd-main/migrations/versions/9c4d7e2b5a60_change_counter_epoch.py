@@ -0,0 +1,35 @@
+"""change counter epoch
+
+Revision ID: 9c4d7e2b5a60
+Revises: 0a7e3c5f9d21
+Create Date: 2026-10-19 16:25:08.941376
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import secrets
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4d7e2b5a60'
+down_revision = '0a7e3c5f9d21'
+branch_labels = None
+depends_on = None
+
+# Copied from app/cache.py at this revision rather than imported, like the
+# 31-bit random value below, so later app changes never alter this migration
+EPOCH = 'epoch'
+
+
+def upgrade():
+    op.execute(
+        sa.text("""
+            INSERT INTO change_counter (name, version)
+            SELECT :name, :version
+            WHERE NOT EXISTS (SELECT 1 FROM change_counter WHERE name = :name)
+        """).bindparams(name=EPOCH, version=secrets.randbits(31))
+    )
+
+
+def downgrade():
+    op.execute(sa.text("DELETE FROM change_counter WHERE name = :name").bindparams(name=EPOCH))
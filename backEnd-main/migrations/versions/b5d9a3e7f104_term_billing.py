@@ -0,0 +1,58 @@
+"""term billing
+
+Revision ID: b5d9a3e7f104
+Revises: 7b3f0e5a9c12
+Create Date: 2026-10-18 17:55:03.614820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d9a3e7f104'
+down_revision = '7b3f0e5a9c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('billing_run',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('term_id', sa.Integer(), nullable=False),
+    sa.Column('students_billed', sa.Integer(), nullable=False),
+    sa.Column('charge_count', sa.Integer(), nullable=False),
+    sa.Column('tuition_total', sa.Float(), nullable=False),
+    sa.Column('boarding_total', sa.Float(), nullable=False),
+    sa.Column('bus_total', sa.Float(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('balance_adjustment', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['term_id'], ['term.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('charge',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('term_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('billing_run_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['billing_run_id'], ['billing_run.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['student.id'], ),
+    sa.ForeignKeyConstraint(['term_id'], ['term.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'term_id', 'kind', name='uq_charge_student_id_term_id_kind')
+    )
+    with op.batch_alter_table('charge', schema=None) as batch_op:
+        batch_op.create_index('ix_charge_billing_run_id', ['billing_run_id'], unique=False)
+        batch_op.create_index('ix_charge_term_id', ['term_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('charge', schema=None) as batch_op:
+        batch_op.drop_index('ix_charge_term_id')
+        batch_op.drop_index('ix_charge_billing_run_id')
+
+    op.drop_table('charge')
+    op.drop_table('billing_run')
@@ -0,0 +1,50 @@
+"""hot lookup indexes
+
+Revision ID: c2f7e9a41b30
+Revises: 8d14f0b6a2c9
+Create Date: 2026-10-18 11:26:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7e9a41b30'
+down_revision = '8d14f0b6a2c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.create_index('ix_student_grade_id', ['grade_id'], unique=False)
+        batch_op.create_index('ix_student_bus_destination_id', ['bus_destination_id'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_student_id_date', ['student_id', 'date'], unique=False)
+        batch_op.create_index('ix_payment_term_id_date', ['term_id', 'date'], unique=False)
+
+    with op.batch_alter_table('fee', schema=None) as batch_op:
+        batch_op.create_index('ix_fee_grade_id_term_id', ['grade_id', 'term_id'], unique=False)
+
+    with op.batch_alter_table('bus_payment', schema=None) as batch_op:
+        batch_op.create_index('ix_bus_payment_student_id_term_id', ['student_id', 'term_id'], unique=False)
+        batch_op.create_index('ix_bus_payment_term_id_payment_date', ['term_id', 'payment_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bus_payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_bus_payment_term_id_payment_date')
+        batch_op.drop_index('ix_bus_payment_student_id_term_id')
+
+    with op.batch_alter_table('fee', schema=None) as batch_op:
+        batch_op.drop_index('ix_fee_grade_id_term_id')
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_term_id_date')
+        batch_op.drop_index('ix_payment_student_id_date')
+
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_bus_destination_id')
+        batch_op.drop_index('ix_student_grade_id')
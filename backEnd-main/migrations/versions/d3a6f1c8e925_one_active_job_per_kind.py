@@ -0,0 +1,34 @@
+"""one active job per kind
+
+Revision ID: d3a6f1c8e925
+Revises: b5d9a3e7f104
+Create Date: 2026-10-19 09:12:44.208531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a6f1c8e925'
+down_revision = 'b5d9a3e7f104'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the oldest active job of each kind; racing enqueues may have added more
+    op.execute("""
+        UPDATE job SET status = 'failed', error = 'Duplicate of an active job of the same kind'
+        WHERE status IN ('queued', 'running')
+          AND id NOT IN (SELECT MIN(id) FROM job WHERE status IN ('queued', 'running') GROUP BY kind)
+    """)
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('ix_job_one_active_kind', ['kind'], unique=True,
+                              sqlite_where=sa.text("status IN ('queued', 'running')"),
+                              postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_one_active_kind')
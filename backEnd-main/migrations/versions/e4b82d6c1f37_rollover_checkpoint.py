@@ -0,0 +1,38 @@
+"""rollover checkpoint
+
+Revision ID: e4b82d6c1f37
+Revises: a71c4e9f2d58
+Create Date: 2026-10-18 15:02:11.480317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b82d6c1f37'
+down_revision = 'a71c4e9f2d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollover_checkpoint',
+    sa.Column('to_term_id', sa.Integer(), nullable=False),
+    sa.Column('from_term_id', sa.Integer(), nullable=False),
+    sa.Column('last_student_id', sa.Integer(), nullable=False),
+    sa.Column('max_student_id', sa.Integer(), nullable=False),
+    sa.Column('total_students', sa.Integer(), nullable=False),
+    sa.Column('students_rolled_over', sa.Integer(), nullable=False),
+    sa.Column('bus_balances_rolled_over', sa.Integer(), nullable=False),
+    sa.Column('prepayments_cleared', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['from_term_id'], ['term.id'], ),
+    sa.ForeignKeyConstraint(['to_term_id'], ['term.id'], ),
+    sa.PrimaryKeyConstraint('to_term_id')
+    )
+
+
+def downgrade():
+    op.drop_table('rollover_checkpoint')
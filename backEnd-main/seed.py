@@ -1,7 +1,16 @@
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from app import create_app, db
-from app.models import Student, Grade, Staff, Fee, Class, Term, BusDestination, BoardingFee
+from app.models import (Student, Grade, Staff, Fee, Class, Term, BusDestination, BoardingFee, Payment, BusPayment,
+                        StudentTermBalance)
+from app.jobs import set_grade_progression
+from app.cache import bump_version, FEES, TERMS, GRADES
+from app.balances import rebuild_paid_totals
+from app.billing import boarding_grade_ids
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+import argparse
 import random
+import time
 
 def seed_data():
     # Seed term
@@ -12,6 +21,7 @@ def seed_data():
         name="Term 2 2025", start_date=datetime(2025, 5, 1), end_date=datetime(2025, 8, 4)
     )
     db.session.add_all([term1, term2])
+    bump_version(TERMS)
     db.session.commit()
     print(f"Seeded terms: {term1.name}, {term2.name}")
 
@@ -22,8 +32,11 @@ def seed_data():
         grade = Grade(name=name)
         db.session.add(grade)
         grades[name] = grade
+    bump_version(GRADES)
     db.session.commit()
     print("Seeded grades:", ", ".join(grade_names))
+    set_grade_progression(grade_names)
+    print("Seeded grade progression.")
 
     # Seed fees for each term and grade
     term_fees = {
@@ -57,6 +70,7 @@ def seed_data():
     # Seed boarding fee
     boarding_fee = BoardingFee(extra_fee=4500)
     db.session.add(boarding_fee)
+    bump_version(FEES)
     db.session.commit()
     print("Seeded boarding fee.")
 
@@ -104,5 +118,188 @@ def seed_data():
     print("Seeded students.")
 
 
-        
-        
+GRADE_NAMES = ["baby", "pp1", "pp2", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
+DESTINATIONS = ["Marangetit", "Olesoi", "Sigor", "Kapsabet", "Chepterit", "Kipkaren",
+                "Lessos", "Mosoriot", "Nandi Hills", "Kaptel"]
+PAYMENT_METHODS = ["mpesa", "bank", "cash"]
+TERM_DAYS = 90
+HOLIDAY_DAYS = 20
+# Share of bus riders who have paid the billed term's bus charge
+BUS_PAYMENT_RATIO = 0.8
+CHUNK_SIZE = 20000
+
+
+def _insert_chunked(model, rows):
+    """Insert rows from an iterator with one executemany per chunk."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(insert(model), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model), chunk)
+
+
+def generate_school(num_students=1000, num_terms=3, payments_per_student=3, bus_ratio=0.3,
+                    boarding_ratio=0.1, seed=0, start_date=date(2025, 1, 6), verbose=False):
+    """
+    Bulk-load a synthetic school into an empty database. The same arguments
+    always produce the same data.
+
+    Terms run back to back from start_date and students are billed for the
+    first. Each student gets payments_per_student fee payments during that
+    term, and most bus riders pay its bus charge; balances and the term
+    summary reflect every payment. Every generated student shares the
+    password "student", because hashing one per student would dominate the
+    load time.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    def log(message):
+        if verbose:
+            print(f"[{time.perf_counter() - started:7.1f}s] {message}")
+
+    terms = []
+    term_start = start_date
+    for number in range(1, num_terms + 1):
+        term_end = term_start + timedelta(days=TERM_DAYS)
+        terms.append({"id": number, "name": f"Term {number}", "start_date": term_start, "end_date": term_end})
+        term_start = term_end + timedelta(days=HOLIDAY_DAYS)
+    db.session.execute(insert(Term), terms)
+
+    db.session.execute(insert(Grade), [{"id": i + 1, "name": name} for i, name in enumerate(GRADE_NAMES)])
+    fees = {
+        (term["id"], grade_id): float(rng.randrange(5000, 9000, 100))
+        for term in terms for grade_id in range(1, len(GRADE_NAMES) + 1)
+    }
+    db.session.execute(insert(Fee), [
+        {"term_id": term_id, "grade_id": grade_id, "amount": amount}
+        for (term_id, grade_id), amount in fees.items()
+    ])
+    destinations = {i + 1: float(rng.randrange(800, 2000, 50)) for i in range(len(DESTINATIONS))}
+    db.session.execute(insert(BusDestination), [
+        {"id": destination_id, "name": DESTINATIONS[destination_id - 1], "charge": charge}
+        for destination_id, charge in destinations.items()
+    ])
+    db.session.execute(insert(BoardingFee), [{"extra_fee": 4500}])
+    db.session.commit()
+    set_grade_progression(GRADE_NAMES)
+    log(f"Loaded {num_terms} terms, {len(GRADE_NAMES)} grades and {len(destinations)} bus destinations")
+
+    password = generate_password_hash("student")
+    boarding_grades = set(boarding_grade_ids())
+    # Only the first term is billed, so every generated payment falls in it
+    billed_term = terms[0]
+    term_opened = datetime.combine(billed_term["start_date"], datetime.min.time())
+    students = []
+    summaries = []
+    payments = []
+    bus_payments = []
+    for student_id in range(1, num_students + 1):
+        grade_id = rng.randint(1, len(GRADE_NAMES))
+        use_bus = rng.random() < bus_ratio
+        is_boarding = rng.random() < boarding_ratio
+        arrears = float(rng.choice([0, 0, 0, rng.randrange(500, 5000, 50)]))
+        fee = fees[(billed_term["id"], grade_id)]
+        destination_id = rng.randint(1, len(destinations)) if use_bus else None
+        billed = fee + (4500 if is_boarding and grade_id in boarding_grades else 0)
+        bus_billed = destinations[destination_id] if use_bus else 0.0
+
+        # Payments in date order, each recording the running balance it left
+        balance = arrears + billed
+        paid_at = sorted(term_opened + timedelta(days=rng.randrange(TERM_DAYS), minutes=rng.randrange(600))
+                         for _ in range(payments_per_student))
+        for date in paid_at:
+            amount = float(rng.randrange(500, 5000, 50))
+            balance -= amount
+            payments.append({
+                "student_id": student_id,
+                "amount": amount,
+                "date": date,
+                "method": rng.choice(PAYMENT_METHODS),
+                "term_id": str(billed_term["id"]),
+                "balance_after_payment": balance,
+                "description": "",
+            })
+
+        # Most riders pay the term's bus charge in its first fortnight
+        bus_balance = bus_billed
+        if use_bus and rng.random() < BUS_PAYMENT_RATIO:
+            bus_payments.append({
+                "student_id": student_id,
+                "term_id": billed_term["id"],
+                "destination_id": destination_id,
+                "amount": bus_billed,
+                "payment_date": term_opened + timedelta(days=rng.randrange(14)),
+            })
+            bus_balance = 0.0
+
+        students.append({
+            "id": student_id,
+            "name": f"Student {student_id}",
+            "admission_number": f"ADM{student_id:07d}",
+            "grade_id": grade_id,
+            "phone": f"07{rng.randrange(10 ** 8):08d}",
+            "balance": balance,
+            "arrears": arrears,
+            "term_fee": fee,
+            "use_bus": use_bus,
+            "bus_balance": bus_balance,
+            "is_boarding": is_boarding,
+            "password": password,
+            "bus_destination_id": destination_id,
+        })
+        # rebuild_paid_totals fills in what they paid
+        summaries.append({
+            "student_id": student_id,
+            "term_id": billed_term["id"],
+            "arrears_brought_forward": arrears,
+            "billed": billed,
+            "paid": 0.0,
+            "payment_count": 0,
+            "bus_billed": bus_billed,
+            "bus_paid": 0.0,
+        })
+    _insert_chunked(Student, students)
+    _insert_chunked(StudentTermBalance, summaries)
+    db.session.commit()
+    log(f"Loaded {num_students} students")
+
+    _insert_chunked(Payment, payments)
+    _insert_chunked(BusPayment, bus_payments)
+    db.session.commit()
+    log(f"Loaded {len(payments)} payments and {len(bus_payments)} bus payments")
+
+    rebuild_paid_totals(db.session)
+    for table in (FEES, TERMS, GRADES):
+        bump_version(table)
+    db.session.commit()
+    log("Rebuilt term balance totals")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed the database with demo or synthetic data.")
+    parser.add_argument("--students", type=int, help="generate a synthetic school of this size instead of the demo data")
+    parser.add_argument("--terms", type=int, default=3)
+    parser.add_argument("--payments-per-student", type=int, default=3)
+    parser.add_argument("--bus-ratio", type=float, default=0.3)
+    parser.add_argument("--boarding-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.students:
+            generate_school(
+                num_students=args.students,
+                num_terms=args.terms,
+                payments_per_student=args.payments_per_student,
+                bus_ratio=args.bus_ratio,
+                boarding_ratio=args.boarding_ratio,
+                seed=args.seed,
+                verbose=True,
+            )
+        else:
+            seed_data()
@@ -0,0 +1,9 @@
+from app import create_app
+from app.jobqueue import run_forever
+
+
+app = create_app()
+
+# Runs queued rollover and promotion jobs one at a time
+if __name__ == '__main__':
+    run_forever(app)
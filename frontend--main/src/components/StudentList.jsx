@@ -3,23 +3,40 @@ import axios from "axios";
 import "../styles/studentList.css";
 import Header from './Header';
 import { useNavigate } from "react-router-dom";
+
+const STUDENT_FIELDS = "id,name,grade_id,balance";
+const PAGE_SIZE = 100;
+const STUDENTS_URL = "https://bfd46d82-011c-4928-9f66-d73819e1918a-00-38r4sqvff4osq.worf.replit.dev:5000/students"; // Default for Admin & Bursar
+
+// GET /students returns one keyset page at a time; next_cursor fetches the next one
+const fetchStudentPage = async (cursor) => {
+  const params = { fields: STUDENT_FIELDS, limit: PAGE_SIZE };
+  if (cursor !== null) params.cursor = cursor;
+  const response = await axios.get(STUDENTS_URL, { params });
+  return response.data;
+};
+
 const StudentList = ({ role, onSelectStudent }) => {
   const [students, setStudents] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
 
   useEffect(() => {
     const fetchStudents = async () => {
       try {
-        let url = "https://bfd46d82-011c-4928-9f66-d73819e1918a-00-38r4sqvff4osq.worf.replit.dev:5000/students"; // Default for Admin & Bursar
-
         if (role === "teacher") {
           const staffId = localStorage.getItem("staffId"); // Assuming staffId is stored after login
-          url = `https://bfd46d82-011c-4928-9f66-d73819e1918a-00-38r4sqvff4osq.worf.replit.dev:5000/staff/${staffId}/students`;
+          const url = `https://bfd46d82-011c-4928-9f66-d73819e1918a-00-38r4sqvff4osq.worf.replit.dev:5000/staff/${staffId}/students`;
+          const response = await axios.get(url);
+          setStudents(response.data);
+          setNextCursor(null);
+        } else {
+          const page = await fetchStudentPage(null);
+          setStudents(page.students);
+          setNextCursor(page.next_cursor);
         }
-
-        const response = await axios.get(url);
-        setStudents(response.data);
       } catch (err) {
         console.error(err);
         setError("Failed to fetch students. Please try again.");
@@ -27,6 +44,21 @@ const StudentList = ({ role, onSelectStudent }) => {
     };
     fetchStudents();
   }, [role]);
+
+  const handleLoadMore = async () => {
+    setLoading(true);
+    try {
+      const page = await fetchStudentPage(nextCursor);
+      setStudents((current) => [...current, ...page.students]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error(err);
+      setError("Failed to fetch more students. Please try again.");
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleAddStudent = () => {
     navigate("/add-student"); // Navigate to AddStudent page
   };
@@ -49,7 +81,7 @@ const StudentList = ({ role, onSelectStudent }) => {
           >
             <h3>{student.name}</h3>
             <p>
-              <strong>Grade:</strong> {student.grade}
+              <strong>Grade:</strong> {student.grade_id}
             </p>
             <p>
               <strong>Balance:</strong> {student.balance}
@@ -57,6 +89,11 @@ const StudentList = ({ role, onSelectStudent }) => {
           </div>
         ))}
       </div>
+      {nextCursor !== null && (
+        <button className="load-more-btn" onClick={handleLoadMore} disabled={loading}>
+          {loading ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 };